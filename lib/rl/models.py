@@ -1,14 +1,67 @@
+import math
 import numpy as np
 import torch.nn as nn
 import torch
-from copy import deepcopy
 from gym import spaces
 import rl_games.common.divergence as divergence
 from rl_games.common.extensions.distributions import CategoricalMasked
 
 # from rl_games.algos_torch.running_mean_std import RunningMeanStd
 
-from lib.rl.moving_avg import RunningMeanStd, RunningMeanStdObs
+from lib.rl.moving_avg import RunningMeanStd, RunningMeanStdObs, RunningMeanStdFusedObs
+
+_HALF_LOG_2PI = 0.5 * math.log(2.0 * math.pi)
+
+
+@torch.jit.script
+def _neglogp(
+    x: torch.Tensor, mean: torch.Tensor, logstd: torch.Tensor, half_log_2pi: float = _HALF_LOG_2PI
+) -> torch.Tensor:
+    # * the inverse std is derived from logstd inside the fused kernel, so there is no divide and no std read
+    d = (x - mean) * torch.exp(-logstd)
+    return 0.5 * (d * d).sum(dim=-1) + logstd.sum(dim=-1) + half_log_2pi * x.size(-1)
+
+
+def _to_bf16(x: torch.Tensor):
+    return x.to(torch.bfloat16) if x.is_floating_point() else x
+
+
+def make_obs_norm(obs_shape, exclude_keys=None, fuse=False) -> nn.Module:
+    if not isinstance(obs_shape, spaces.Dict):
+        return RunningMeanStd(obs_shape)
+    if fuse:
+        return RunningMeanStdFusedObs(obs_shape, exclude_keys=exclude_keys)
+    return RunningMeanStdObs(obs_shape, exclude_keys=exclude_keys)
+
+
+def split_a2c_state_dict(state_dict):
+    """
+    splits a model state_dict into the base-model entries and the a2c_network entries (with the prefix stripped)
+    """
+    prefix = "a2c_network."
+    base_state, net_state = {}, {}
+    for k, v in state_dict.items():
+        if k.startswith(prefix):
+            net_state[k[len(prefix) :]] = v
+        else:
+            base_state[k] = v
+    return base_state, net_state
+
+
+def compile_forward(module: nn.Module):
+    # * compile the bound forward instead of wrapping the module, so that state_dict keys stay unchanged
+    assert hasattr(torch, "compile"), "compile_network requires torch>=2.0"
+    module.forward = torch.compile(module.forward, mode="reduce-overhead", fullgraph=False)
+    return module
+
+
+def mark_batch_dim(obs, static: bool):
+    # * rollouts always see num_envs rows, so their graph is specialized; training minibatches get a dynamic graph
+    import torch._dynamo
+
+    mark = torch._dynamo.mark_static if static else torch._dynamo.mark_dynamic
+    for v in obs.values() if isinstance(obs, dict) else [obs]:
+        mark(v, 0)
 
 
 class BaseModel:
@@ -49,6 +102,8 @@ class BaseModelNetwork(nn.Module):
         normalize_input,
         value_size,
         normalize_input_excluded_keys=None,
+        fuse_obs_norm=False,
+        amp_bf16=False,
         **kwargs,
     ):
         nn.Module.__init__(self)
@@ -56,18 +111,26 @@ class BaseModelNetwork(nn.Module):
         self.normalize_value = normalize_value
         self.normalize_input = normalize_input
         self.value_size = value_size
+        self.amp_bf16 = amp_bf16
 
         if normalize_value:
             self.value_mean_std = RunningMeanStd((self.value_size,))  # GeneralizedMovingStats((self.value_size,)) #
         if normalize_input:
-            if isinstance(obs_shape, spaces.Dict):
-                self.running_mean_std = RunningMeanStdObs(obs_shape, exclude_keys=normalize_input_excluded_keys)
-            else:
-                self.running_mean_std = RunningMeanStd(obs_shape)
+            self.running_mean_std = make_obs_norm(obs_shape, normalize_input_excluded_keys, fuse_obs_norm)
 
     def norm_obs(self, observation):
         with torch.no_grad():
-            return self.running_mean_std(observation) if self.normalize_input else observation
+            observation = self.running_mean_std(observation) if self.normalize_input else observation
+            if self.amp_bf16:
+                # * statistics are updated and applied in full precision, only the normalized output is cast
+                if isinstance(observation, dict):
+                    observation = {k: _to_bf16(v) for k, v in observation.items()}
+                else:
+                    observation = _to_bf16(observation)
+            return observation
+
+    def autocast(self):
+        return torch.autocast(device_type="cuda", dtype=torch.bfloat16, enabled=self.amp_bf16)
 
     def denorm_value(self, value):
         with torch.no_grad():
@@ -103,14 +166,17 @@ class ModelA2C(BaseModel):
             action_masks = input_dict.get("action_masks", None)
             prev_actions = input_dict.get("prev_actions", None)
             input_dict["obs"] = self.norm_obs(input_dict["obs"])
-            logits, value, states = self.a2c_network(input_dict)
+            with self.autocast():
+                logits, value, states = self.a2c_network(input_dict)
+            logits, value = logits.float(), value.float()
+            # * action_masks, when given, is expected as a bool tensor already on the model device
+            categorical = CategoricalMasked(logits=logits, masks=action_masks)
 
             if is_train:
-                categorical = CategoricalMasked(logits=logits, masks=action_masks)
                 prev_neglogp = -categorical.log_prob(prev_actions)
                 entropy = categorical.entropy()
                 result = {
-                    "prev_neglogp": torch.squeeze(prev_neglogp),
+                    "prev_neglogp": prev_neglogp,
                     "logits": categorical.logits,
                     "values": value,
                     "entropy": entropy,
@@ -118,11 +184,10 @@ class ModelA2C(BaseModel):
                 }
                 return result
             else:
-                categorical = CategoricalMasked(logits=logits, masks=action_masks)
                 selected_action = categorical.sample().long()
                 neglogp = -categorical.log_prob(selected_action)
                 result = {
-                    "neglogpacs": torch.squeeze(neglogp),
+                    "neglogpacs": neglogp,
                     "values": self.denorm_value(value),
                     "actions": selected_action,
                     "logits": categorical.logits,
@@ -137,9 +202,10 @@ class ModelA2CContinuousLogStd(BaseModel):
         self.network_builder = network
 
     class Network(BaseModelNetwork):
-        def __init__(self, a2c_network, **kwargs):
+        def __init__(self, a2c_network, compile_network=False, **kwargs):
             BaseModelNetwork.__init__(self, **kwargs)
-            self.a2c_network = a2c_network
+            self.a2c_network = compile_forward(a2c_network) if compile_network else a2c_network
+            self._compiled = compile_network
 
         def is_rnn(self):
             return self.a2c_network.is_rnn()
@@ -151,17 +217,28 @@ class ModelA2CContinuousLogStd(BaseModel):
             return self.a2c_network.get_default_rnn_state()
 
         def forward(self, input_dict):
+            # * rollout results never need grad, so skip autograd and view tracking for them; in training mode the
+            # * running statistics get updated and must stay normal tensors
+            if input_dict.get("is_train", True) or self.training:
+                return self._forward(input_dict)
+            with torch.inference_mode():
+                return self._forward(input_dict)
+
+        def _forward(self, input_dict):
             is_train = input_dict.get("is_train", True)
             prev_actions = input_dict.get("prev_actions", None)
             input_dict["obs"] = self.norm_obs(input_dict["obs"])
-            mu, logstd, value, states = self.a2c_network(input_dict)
+            if self._compiled:
+                mark_batch_dim(input_dict["obs"], static=not is_train)
+            with self.autocast():
+                mu, logstd, value, states = self.a2c_network(input_dict)
+            mu, logstd, value = mu.float(), logstd.float(), value.float()
             sigma = torch.exp(logstd)
-            distr = torch.distributions.Normal(mu, sigma, validate_args=False)
             if is_train:
-                entropy = distr.entropy().sum(dim=-1)
-                prev_neglogp = self.neglogp(prev_actions, mu, sigma, logstd)
+                entropy = (0.5 + _HALF_LOG_2PI + logstd).sum(dim=-1)
+                prev_neglogp = self.neglogp(prev_actions, mu, logstd)
                 result = {
-                    "prev_neglogp": torch.squeeze(prev_neglogp),
+                    "prev_neglogp": prev_neglogp,
                     "values": value,
                     "entropy": entropy,
                     "rnn_states": states,
@@ -170,10 +247,10 @@ class ModelA2CContinuousLogStd(BaseModel):
                 }
                 return result
             else:
-                selected_action = distr.sample()
-                neglogp = self.neglogp(selected_action, mu, sigma, logstd)
+                selected_action = mu + sigma * torch.randn_like(mu)
+                neglogp = self.neglogp(selected_action, mu, logstd)
                 result = {
-                    "neglogpacs": torch.squeeze(neglogp),
+                    "neglogpacs": neglogp,
                     "values": self.denorm_value(value),
                     "actions": selected_action,
                     "rnn_states": states,
@@ -182,12 +259,8 @@ class ModelA2CContinuousLogStd(BaseModel):
                 }
                 return result
 
-        def neglogp(self, x, mean, std, logstd):
-            return (
-                0.5 * (((x - mean) / std) ** 2).sum(dim=-1)
-                + 0.5 * np.log(2.0 * np.pi) * x.size()[-1]
-                + logstd.sum(dim=-1)
-            )
+        def neglogp(self, x, mean, logstd):
+            return _neglogp(x, mean, logstd)
 
 
 class SepModelA2CContinuousLogStd(BaseModel):
@@ -196,22 +269,30 @@ class SepModelA2CContinuousLogStd(BaseModel):
         self.network_builder = network
 
     class Network(nn.Module):
-        def __init__(self, a2c_network, **kwargs):
+        def __init__(self, a2c_network, compile_network=False, **kwargs):
             super().__init__()
-            input_kwargs = deepcopy(kwargs)
+            input_kwargs = dict(kwargs)
 
             def sep_shape(x):
+                # * (hand, feature) with the right hand first, so both hands share one set of stacked statistics
                 return spaces.Box(
                     low=-np.inf,
                     high=np.inf,
-                    shape=(x.shape[0] // 2,),
+                    shape=(2, x.shape[0] // 2),
                 )
 
             input_kwargs["obs_shape"] = spaces.Dict({k: sep_shape(v) for k, v in input_kwargs["obs_shape"].items()})
+            input_kwargs["value_size"] = 2 * input_kwargs["value_size"]
+            self._hand_obs_dims = {k: v.shape[-1] for k, v in input_kwargs["obs_shape"].items()}
 
-            self.left_hand_base = BaseModelNetwork(**input_kwargs)
-            self.right_hand_base = BaseModelNetwork(**input_kwargs)
+            self.shared_base = BaseModelNetwork(**input_kwargs)
             self.a2c_network = a2c_network
+            self._out_buffers = {}
+            self._has_rnn_states = self.a2c_network.is_rnn()
+            if compile_network:
+                compile_forward(self.a2c_network.right_hand_net)
+                compile_forward(self.a2c_network.left_hand_net)
+            self._compiled = compile_network
 
         def is_rnn(self):
             return self.a2c_network.is_rnn()
@@ -224,37 +305,80 @@ class SepModelA2CContinuousLogStd(BaseModel):
 
         def load_state_dict(self, state_dict):
             assert type(state_dict) is list
-            self.right_hand_base.load_state_dict({k: v for k, v in state_dict[0].items() if "a2c_network" not in k})
-            self.left_hand_base.load_state_dict({k: v for k, v in state_dict[1].items() if "a2c_network" not in k})
-            self.a2c_network.right_hand_net.load_state_dict(
-                {k[12:]: v for k, v in state_dict[0].items() if "a2c_network" in k}
-            )
-            self.a2c_network.left_hand_net.load_state_dict(
-                {k[12:]: v for k, v in state_dict[1].items() if "a2c_network" in k}
-            )
+            rh_base_state, rh_net_state = split_a2c_state_dict(state_dict[0])
+            lh_base_state, lh_net_state = split_a2c_state_dict(state_dict[1])
+            shared_base_state = {}
+            for k, v in self.shared_base.state_dict().items():
+                if v.dim() == 0:
+                    # * sample counts only drive statistic updates, which this model never runs
+                    shared_base_state[k] = rh_base_state[k]
+                else:
+                    shared_base_state[k] = torch.stack([rh_base_state[k], lh_base_state[k]]).view(v.shape)
+            self.shared_base.load_state_dict(shared_base_state)
+            self.a2c_network.right_hand_net.load_state_dict(rh_net_state)
+            self.a2c_network.left_hand_net.load_state_dict(lh_net_state)
+
+        def _cat_hands(self, name, rh, lh):
+            # * persistent output buffers, only for intermediates that never leave forward
+            if torch.is_grad_enabled():
+                return torch.cat([rh, lh], dim=-1)
+            shape = (*rh.shape[:-1], rh.shape[-1] + lh.shape[-1])
+            buf = self._out_buffers.get(name, None)
+            if (
+                buf is None
+                or buf.shape != shape
+                or buf.dtype != rh.dtype
+                or buf.device != rh.device
+                # * an inference tensor can not be written outside inference_mode (and vice versa is not wanted)
+                or buf.is_inference() != torch.is_inference_mode_enabled()
+            ):
+                buf = self._out_buffers[name] = rh.new_empty(shape)
+            return torch.cat([rh, lh], dim=-1, out=buf)
 
         def forward(self, input_dict):
+            # * rollout results never need grad, so skip autograd and view tracking for them; in training mode the
+            # * running statistics get updated and must stay normal tensors
+            if input_dict.get("is_train", True) or self.training:
+                return self._forward(input_dict)
+            with torch.inference_mode():
+                return self._forward(input_dict)
+
+        def _forward(self, input_dict):
             is_train = input_dict.get("is_train", True)
             prev_actions = input_dict.get("prev_actions", None)
-            lh_input_dict = deepcopy(input_dict)
-            rh_input_dict = deepcopy(input_dict)
-            for k, v in input_dict["obs"].items():
-                rh_input_dict["obs"][k] = v[:, : v.shape[1] // 2]
-                lh_input_dict["obs"][k] = v[:, v.shape[1] // 2 :]
-            lh_input_dict["obs"] = self.left_hand_base.norm_obs(lh_input_dict["obs"])
-            rh_input_dict["obs"] = self.right_hand_base.norm_obs(rh_input_dict["obs"])
-            lh_mu, lh_logstd, lh_value, lh_states = self.a2c_network.left_hand_net(lh_input_dict)  # ! TODO
-            lh_sigma = torch.exp(lh_logstd)
-            lh_distr = torch.distributions.Normal(lh_mu, lh_sigma, validate_args=False)
-            rh_mu, rh_logstd, rh_value, rh_states = self.a2c_network.right_hand_net(rh_input_dict)
-            rh_sigma = torch.exp(rh_logstd)
-            rh_distr = torch.distributions.Normal(rh_mu, rh_sigma, validate_args=False)
+            # * view each obs as (B, 2, F) and normalize both hands at once, then hand out per-hand views
+            obs = self.shared_base.norm_obs(
+                {k: input_dict["obs"][k].unflatten(1, (2, d)) for k, d in self._hand_obs_dims.items()}
+            )
+            rh_obs, lh_obs = {}, {}
+            for k, v in obs.items():
+                rh_obs[k], lh_obs[k] = v.unbind(1)
+            rh_input_dict = dict(input_dict)
+            lh_input_dict = dict(input_dict)
+            rh_input_dict["obs"] = rh_obs
+            lh_input_dict["obs"] = lh_obs
+            if self._compiled:
+                mark_batch_dim(rh_obs, static=not is_train)
+                mark_batch_dim(lh_obs, static=not is_train)
+            with self.shared_base.autocast():
+                rh_mu, rh_logstd, rh_value, rh_states = self.a2c_network.right_hand_net(rh_input_dict)
+                lh_mu, lh_logstd, lh_value, lh_states = self.a2c_network.left_hand_net(lh_input_dict)  # ! TODO
+            # * the two hands do not share weights, so only the distribution math is batched, over [rh | lh] actions
+            num_hand_actions = rh_mu.shape[-1]
+            mu = torch.cat([rh_mu, lh_mu], dim=-1).float()
+            logstd = self._cat_hands("logstd", rh_logstd.float(), lh_logstd.float())
+            sigma = torch.exp(logstd)
+            if self.shared_base.normalize_value:
+                value = self.shared_base.denorm_value(self._cat_hands("value", rh_value.float(), lh_value.float()))
+            else:
+                value = torch.cat([rh_value, lh_value], dim=-1).float()
+            states = torch.cat([rh_states, lh_states], dim=-1) if self._has_rnn_states else None
             if is_train:
                 assert False, "Not implemented"
-                entropy = distr.entropy().sum(dim=-1)
-                prev_neglogp = self.neglogp(prev_actions, mu, sigma, logstd)
+                entropy = (0.5 + _HALF_LOG_2PI + logstd).sum(dim=-1)
+                prev_neglogp = self.neglogp(prev_actions, mu, logstd)
                 result = {
-                    "prev_neglogp": torch.squeeze(prev_neglogp),
+                    "prev_neglogp": prev_neglogp,
                     "values": value,
                     "entropy": entropy,
                     "rnn_states": states,
@@ -263,37 +387,22 @@ class SepModelA2CContinuousLogStd(BaseModel):
                 }
                 return result
             else:
-                rh_selected_action = rh_distr.sample()
-                rh_neglogp = self.neglogp(rh_selected_action, rh_mu, rh_sigma, rh_logstd)
-                rh_result = {
-                    "neglogpacs": torch.squeeze(rh_neglogp),
-                    "values": self.right_hand_base.denorm_value(rh_value),  # ! TODO
-                    "actions": rh_selected_action,
-                    "rnn_states": rh_states,
-                    "mus": rh_mu,
-                    "sigmas": rh_sigma,
-                }
-                lh_selected_action = lh_distr.sample()
-                lh_neglogp = self.neglogp(lh_selected_action, lh_mu, lh_sigma, lh_logstd)
-                lh_result = {
-                    "neglogpacs": torch.squeeze(lh_neglogp),
-                    "values": self.left_hand_base.denorm_value(lh_value),  # ! TODO
-                    "actions": lh_selected_action,
-                    "rnn_states": lh_states,
-                    "mus": lh_mu,
-                    "sigmas": lh_sigma,
+                selected_action = mu + sigma * torch.randn_like(mu)
+                # * per-hand neglogp of shape (B, 2), flattened to [rh..., lh...] as the per-hand results used to be
+                neglogp = self.neglogp(
+                    selected_action.unflatten(-1, (2, num_hand_actions)),
+                    mu.unflatten(-1, (2, num_hand_actions)),
+                    logstd.unflatten(-1, (2, num_hand_actions)),
+                )
+                result = {
+                    "neglogpacs": neglogp.t().flatten(),
+                    "values": value,
+                    "actions": selected_action,
+                    "rnn_states": states,
+                    "mus": mu,
+                    "sigmas": sigma,
                 }
-                result = {}
-                for k in rh_result.keys():
-                    if rh_result[k] is None:
-                        result[k] = None
-                        continue
-                    result[k] = torch.cat([rh_result[k], lh_result[k]], dim=-1)
                 return result
 
-        def neglogp(self, x, mean, std, logstd):
-            return (
-                0.5 * (((x - mean) / std) ** 2).sum(dim=-1)
-                + 0.5 * np.log(2.0 * np.pi) * x.size()[-1]
-                + logstd.sum(dim=-1)
-            )
+        def neglogp(self, x, mean, logstd):
+            return _neglogp(x, mean, logstd)
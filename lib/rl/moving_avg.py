@@ -115,3 +115,33 @@ class RunningMeanStdObs(nn.Module):
     def forward(self, input, denorm=False):
         res = {k: self.running_mean_std[k](v, denorm) if k not in self._exclude_keys else v for k, v in input.items()}
         return res
+
+
+class RunningMeanStdFusedObs(nn.Module):
+    """
+    normalizes all non-excluded keys of a dict obs with one RunningMeanStd over their concatenation
+    """
+
+    def __init__(
+        self,
+        insize,
+        epsilon=1e-05,
+        norm_only=False,
+        exclude_keys: list | None = None,
+    ):
+        assert isinstance(insize, spaces.Dict)
+        exclude_keys = exclude_keys or []
+        super(RunningMeanStdFusedObs, self).__init__()
+        self._keys = [k for k in insize.keys() if k not in exclude_keys]
+        assert len(self._keys) > 0, "nothing to normalize"
+        shapes = [insize[k].shape for k in self._keys]
+        assert all(s[:-1] == shapes[0][:-1] for s in shapes), "keys must only differ in the last dim"
+        self._splits = [s[-1] for s in shapes]
+        self.running_mean_std = RunningMeanStd((*shapes[0][:-1], sum(self._splits)), epsilon, norm_only=norm_only)
+        self._exclude_keys = exclude_keys
+
+    def forward(self, input, denorm=False):
+        x = torch.cat([input[k] for k in self._keys], dim=-1)
+        res = dict(input)
+        res.update(zip(self._keys, self.running_mean_std(x, denorm).split(self._splits, dim=-1)))
+        return res
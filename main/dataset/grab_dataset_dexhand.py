@@ -8,7 +8,6 @@ import torch
 from pytorch3d.ops import sample_points_from_meshes
 from pytorch3d.structures import Meshes
 from scipy.spatial.transform import Rotation as R
-from scipy.spatial.transform import Slerp
 from smplx.lbs import batch_rigid_transform, batch_rodrigues
 from torch.utils.data import Dataset
 
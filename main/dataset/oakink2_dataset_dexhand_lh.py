@@ -11,7 +11,6 @@ from pytorch3d.ops import sample_points_from_meshes
 from pytorch3d.structures import Meshes
 from scipy.ndimage import gaussian_filter1d
 from scipy.spatial.transform import Rotation as R
-from scipy.spatial.transform import Slerp
 from smplx.lbs import batch_rigid_transform, batch_rodrigues
 from termcolor import cprint
 from torch.utils.data import Dataset
@@ -1,10 +1,12 @@
+import functools
 import math
-import random
+import os
 from copy import deepcopy
 from re import L
 from typing import List, Optional, Union
 
 import cv2
+import numba
 import numpy as np
 import torch
 import torch.nn as nn
@@ -21,8 +23,6 @@ from pytorch3d.transforms import (
     quaternion_to_matrix,
     rotation_6d_to_matrix,
 )
-from scipy.spatial.transform import Rotation as R
-from scipy.spatial.transform import Slerp
 
 
 class RandomOcclusion:
@@ -37,7 +37,9 @@ class RandomOcclusion:
         self.occlusion_prob = occlusion_prob
 
     def __call__(self, results):
-        if np.random.rand() > self.occlusion_prob:
+        # * one draw for the gate, area, ratio and the two offsets, from the global (seeded, per-worker) numpy rng
+        p = np.random.rand(5)
+        if p[0] > self.occlusion_prob:
             return results
 
         xmin, ymin, xmax, ymax = results["bbox"]
@@ -47,30 +49,88 @@ class RandomOcclusion:
 
         area_min = 0.0
         area_max = 0.2
-        synth_area = (random.random() * (area_max - area_min) + area_min) * (xmax - xmin) * (ymax - ymin)
+        synth_area = (p[1] * (area_max - area_min) + area_min) * (xmax - xmin) * (ymax - ymin)
 
         ratio_min = 0.5
         ratio_max = 1 / 0.5
-        synth_ratio = random.random() * (ratio_max - ratio_min) + ratio_min
+        synth_ratio = p[2] * (ratio_max - ratio_min) + ratio_min
 
         synth_h = math.sqrt(synth_area * synth_ratio)
-        synth_w = math.sqrt(synth_area / synth_ratio)
-        synth_xmin = random.random() * ((xmax - xmin) - synth_w - 1) + xmin
-        synth_ymin = random.random() * ((ymax - ymin) - synth_h - 1) + ymin
+        if synth_h == 0:
+            return results
+        # * sqrt(area / ratio) == area / sqrt(area * ratio)
+        synth_w = synth_area / synth_h
+        synth_xmin = p[3] * ((xmax - xmin) - synth_w) + xmin
+        synth_ymin = p[4] * ((ymax - ymin) - synth_h) + ymin
 
         if synth_xmin >= 0 and synth_ymin >= 0 and synth_xmin + synth_w < imgwidth and synth_ymin + synth_h < imgheight:
             synth_xmin = int(synth_xmin)
             synth_ymin = int(synth_ymin)
             synth_w = int(synth_w)
             synth_h = int(synth_h)
-            img[synth_ymin : synth_ymin + synth_h, synth_xmin : synth_xmin + synth_w, :] = (
-                np.random.rand(synth_h, synth_w, 3) * 255
+            # * draw the uint8 noise directly, no float64 (h, w, 3) temporary
+            img[synth_ymin : synth_ymin + synth_h, synth_xmin : synth_xmin + synth_w, :] = np.random.randint(
+                0, 256, size=(synth_h, synth_w, 3), dtype=np.uint8
             )
 
         results["image"] = img
         return results
 
 
+class BatchRandomOcclusion(nn.Module):
+    """Batched, on-device version of `RandomOcclusion`, applied after collate.
+
+    Args:
+        occlusion_prob (float): probability of each image having
+        occlusion. Default: 0.5
+    """
+
+    def __init__(self, occlusion_prob=0.5):
+        super().__init__()
+        self.occlusion_prob = occlusion_prob
+
+    @torch.no_grad()
+    def forward(self, imgs, bboxes):
+        """
+        Args:
+            imgs (torch.Tensor): uint8 images, shape (B, C, H, W)
+            bboxes (torch.Tensor): xyxy boxes, shape (B, 4)
+
+        Returns:
+            torch.Tensor: occluded images, shape (B, C, H, W)
+        """
+        B, _, H, W = imgs.shape
+        bboxes = bboxes.to(device=imgs.device, dtype=torch.float32)
+        xmin, ymin, xmax, ymax = bboxes.unbind(-1)
+        u = torch.rand((5, B), device=imgs.device)
+
+        area_min, area_max = 0.0, 0.2
+        synth_area = (u[0] * (area_max - area_min) + area_min) * (xmax - xmin) * (ymax - ymin)
+        ratio_min, ratio_max = 0.5, 1 / 0.5
+        synth_ratio = u[1] * (ratio_max - ratio_min) + ratio_min
+
+        synth_h = torch.sqrt(synth_area * synth_ratio)
+        synth_w = torch.sqrt(synth_area / synth_ratio)
+        synth_xmin = u[2] * ((xmax - xmin) - synth_w) + xmin
+        synth_ymin = u[3] * ((ymax - ymin) - synth_h) + ymin
+
+        apply = (
+            (u[4] <= self.occlusion_prob)
+            & (synth_xmin >= 0)
+            & (synth_ymin >= 0)
+            & (synth_xmin + synth_w < W)
+            & (synth_ymin + synth_h < H)
+        )
+        x0, y0 = synth_xmin.long(), synth_ymin.long()
+        x1, y1 = x0 + synth_w.long(), y0 + synth_h.long()
+        cols = torch.arange(W, device=imgs.device)
+        rows = torch.arange(H, device=imgs.device)
+        in_x = (cols >= x0[:, None]) & (cols < x1[:, None])  # (B, W)
+        in_y = (rows >= y0[:, None]) & (rows < y1[:, None])  # (B, H)
+        mask = (in_y[:, :, None] & in_x[:, None, :]) & apply[:, None, None]  # (B, H, W)
+        return torch.where(mask[:, None], torch.randint_like(imgs, 0, 256), imgs)
+
+
 class Compose:
     def __init__(self, transforms: list):
         """Composes several transforms together. This transform does not
@@ -87,7 +147,7 @@ class Compose:
             raise ValueError(f"Invalid convention {convention}.")
         if isinstance(rotation, np.ndarray):
             data_type = "numpy"
-            rotation = torch.FloatTensor(rotation)
+            rotation = torch.from_numpy(np.ascontiguousarray(rotation)).float()
         elif isinstance(rotation, torch.Tensor):
             data_type = "tensor"
         else:
@@ -102,40 +162,122 @@ class Compose:
         return rotation
 
 
-def aa_to_rotmat(axis_angle: Union[torch.Tensor, np.ndarray]) -> Union[torch.Tensor, np.ndarray]:
+def _np_to_torch_wrap(func):
+    """Let a single torch rotation conversion also take numpy input (as float32) without going through Compose."""
+
+    @functools.wraps(func)
+    def wrapper(rotation, *args, **kwargs):
+        if isinstance(rotation, np.ndarray):
+            return func(torch.from_numpy(np.ascontiguousarray(rotation)).float(), *args, **kwargs).numpy()
+        elif isinstance(rotation, torch.Tensor):
+            return func(rotation, *args, **kwargs)
+        else:
+            raise TypeError("Type of rotation should be torch.Tensor or numpy.ndarray")
+
+    return wrapper
+
+
+def _quat_to_rot6d(quaternions: torch.Tensor) -> torch.Tensor:
+    # * only the first two rows of the rotation matrix, laid out as matrix_to_rotation_6d does
+    r, i, j, k = torch.unbind(quaternions, -1)
+    two_s = 2.0 / (quaternions * quaternions).sum(-1)
+    rot6d = torch.stack(
+        (
+            1 - two_s * (j * j + k * k),
+            two_s * (i * j - k * r),
+            two_s * (i * k + j * r),
+            two_s * (i * j + k * r),
+            1 - two_s * (i * i + k * k),
+            two_s * (j * k - i * r),
+        ),
+        -1,
+    )
+    return rot6d
+
+
+def _axis_angle_to_matrix(axis_angle: torch.Tensor, fast: bool = False) -> torch.Tensor:
+    if not fast:
+        return axis_angle_to_matrix(axis_angle)
+    # * Rodrigues on the unnormalized axis: R = I + sin(t)/t [v]x + (1 - cos(t))/t^2 [v]x^2,
+    # * both factors written with sinc so they stay smooth at t = 0
+    theta = axis_angle.norm(dim=-1)[..., None, None]
+    x, y, z = torch.unbind(axis_angle, -1)
+    zeros = torch.zeros_like(x)
+    skew = torch.stack((zeros, -z, y, z, zeros, -x, -y, x, zeros), -1).unflatten(-1, (3, 3))
+    eye = torch.eye(3, dtype=axis_angle.dtype, device=axis_angle.device)
+    half_sinc = torch.sinc(theta / (2 * math.pi))
+    return eye + torch.sinc(theta / math.pi) * skew + 0.5 * half_sinc * half_sinc * (skew @ skew)
+
+
+def _matrix_to_axis_angle(matrix: torch.Tensor, fast: bool = False, eps: float = 1e-6) -> torch.Tensor:
+    if not fast:
+        return quaternion_to_axis_angle(matrix_to_quaternion(matrix))
+    # * closed-form Rodrigues extraction, not stable for angles close to pi
+    omega = torch.stack(
+        (
+            matrix[..., 2, 1] - matrix[..., 1, 2],
+            matrix[..., 0, 2] - matrix[..., 2, 0],
+            matrix[..., 1, 0] - matrix[..., 0, 1],
+        ),
+        -1,
+    )
+    omega_norm = omega.norm(dim=-1, keepdim=True)  # 2 * sin(theta)
+    trace = matrix[..., 0, 0] + matrix[..., 1, 1] + matrix[..., 2, 2]
+    theta = torch.atan2(omega_norm, trace.unsqueeze(-1) - 1)
+    small = omega_norm < eps
+    factor = torch.where(small, torch.full_like(theta, 0.5), theta / omega_norm.clamp_min(eps))
+    return omega * factor
+
+
+def _axis_angle_to_rot6d(axis_angle: torch.Tensor) -> torch.Tensor:
+    return _quat_to_rot6d(axis_angle_to_quaternion(axis_angle))
+
+
+def _rot6d_to_axis_angle(rotation_6d: torch.Tensor, fast: bool = False) -> torch.Tensor:
+    return _matrix_to_axis_angle(rotation_6d_to_matrix(rotation_6d), fast=fast)
+
+
+def _rot6d_to_quat(rotation_6d: torch.Tensor) -> torch.Tensor:
+    return matrix_to_quaternion(rotation_6d_to_matrix(rotation_6d))
+
+
+@_np_to_torch_wrap
+def aa_to_rotmat(axis_angle: Union[torch.Tensor, np.ndarray], fast: bool = False) -> Union[torch.Tensor, np.ndarray]:
     """
     Convert axis_angle to rotation matrixs.
     Args:
         axis_angle (Union[torch.Tensor, numpy.ndarray]): input shape
                 should be (..., 3). ndim of input is unlimited.
+        fast (bool, optional): use the closed-form Rodrigues formula instead of
+                the quaternion path. Defaults to False.
 
     Returns:
         Union[torch.Tensor, numpy.ndarray]: shape would be (..., 3, 3).
     """
     if axis_angle.shape[-1] != 3:
         raise ValueError(f"Invalid input axis angles shape f{axis_angle.shape}.")
-    t = Compose([axis_angle_to_matrix])
-    return t(axis_angle)
+    return _axis_angle_to_matrix(axis_angle, fast=fast)
 
 
-def rotmat_to_aa(matrix: Union[torch.Tensor, np.ndarray]) -> Union[torch.Tensor, np.ndarray]:
+@_np_to_torch_wrap
+def rotmat_to_aa(matrix: Union[torch.Tensor, np.ndarray], fast: bool = False) -> Union[torch.Tensor, np.ndarray]:
     """Convert rotation matrixs to axis angles.
 
     Args:
         matrix (Union[torch.Tensor, numpy.ndarray]): input shape
                 should be (..., 3, 3). ndim of input is unlimited.
-        convention (str, optional): Convention string of three letters
-                from {“x”, “y”, and “z”}. Defaults to 'xyz'.
+        fast (bool, optional): use the closed-form Rodrigues extraction,
+                only for inputs known to be away from a rotation of pi. Defaults to False.
 
     Returns:
         Union[torch.Tensor, numpy.ndarray]: shape would be (..., 3).
     """
     if matrix.shape[-1] != 3 or matrix.shape[-2] != 3:
         raise ValueError(f"Invalid rotation matrix  shape f{matrix.shape}.")
-    t = Compose([matrix_to_quaternion, quaternion_to_axis_angle])
-    return t(matrix)
+    return _matrix_to_axis_angle(matrix, fast=fast)
 
 
+@_np_to_torch_wrap
 def aa_to_quat(axis_angle: Union[torch.Tensor, np.ndarray]) -> Union[torch.Tensor, np.ndarray]:
     """
     Convert axis_angle to quaternions.
@@ -148,10 +290,10 @@ def aa_to_quat(axis_angle: Union[torch.Tensor, np.ndarray]) -> Union[torch.Tenso
     """
     if axis_angle.shape[-1] != 3:
         raise ValueError(f"Invalid input axis angles f{axis_angle.shape}.")
-    t = Compose([axis_angle_to_quaternion])
-    return t(axis_angle)
+    return axis_angle_to_quaternion(axis_angle)
 
 
+@_np_to_torch_wrap
 def aa_to_rot6d(axis_angle: Union[torch.Tensor, np.ndarray]) -> Union[torch.Tensor, np.ndarray]:
     """Convert axis angles to rotation 6d representations.
 
@@ -169,16 +311,18 @@ def aa_to_rot6d(axis_angle: Union[torch.Tensor, np.ndarray]) -> Union[torch.Tens
     """
     if axis_angle.shape[-1] != 3:
         raise ValueError(f"Invalid input axis_angle f{axis_angle.shape}.")
-    t = Compose([axis_angle_to_matrix, matrix_to_rotation_6d])
-    return t(axis_angle)
+    return _axis_angle_to_rot6d(axis_angle)
 
 
-def rot6d_to_aa(rotation_6d: Union[torch.Tensor, np.ndarray]) -> Union[torch.Tensor, np.ndarray]:
+@_np_to_torch_wrap
+def rot6d_to_aa(rotation_6d: Union[torch.Tensor, np.ndarray], fast: bool = False) -> Union[torch.Tensor, np.ndarray]:
     """Convert rotation 6d representations to axis angles.
 
     Args:
         rotation_6d (Union[torch.Tensor, numpy.ndarray]): input shape
                 should be (..., 6). ndim of input is unlimited.
+        fast (bool, optional): use the closed-form Rodrigues extraction,
+                only for inputs known to be away from a rotation of pi. Defaults to False.
 
     Returns:
         Union[torch.Tensor, numpy.ndarray]: shape would be (..., 3).
@@ -190,10 +334,10 @@ def rot6d_to_aa(rotation_6d: Union[torch.Tensor, np.ndarray]) -> Union[torch.Ten
     """
     if rotation_6d.shape[-1] != 6:
         raise ValueError(f"Invalid input rotation_6d f{rotation_6d.shape}.")
-    t = Compose([rotation_6d_to_matrix, matrix_to_quaternion, quaternion_to_axis_angle])
-    return t(rotation_6d)
+    return _rot6d_to_axis_angle(rotation_6d, fast=fast)
 
 
+@_np_to_torch_wrap
 def quat_to_aa(quaternions: Union[torch.Tensor, np.ndarray]) -> Union[torch.Tensor, np.ndarray]:
     """Convert quaternions to axis angles.
 
@@ -205,10 +349,10 @@ def quat_to_aa(quaternions: Union[torch.Tensor, np.ndarray]) -> Union[torch.Tens
     """
     if quaternions.shape[-1] != 4:
         raise ValueError(f"Invalid input quaternions f{quaternions.shape}.")
-    t = Compose([quaternion_to_axis_angle])
-    return t(quaternions)
+    return quaternion_to_axis_angle(quaternions)
 
 
+@_np_to_torch_wrap
 def rot6d_to_rotmat(rotation_6d: Union[torch.Tensor, np.ndarray]) -> Union[torch.Tensor, np.ndarray]:
     """Convert rotation 6d representations to rotation matrixs.
 
@@ -225,10 +369,10 @@ def rot6d_to_rotmat(rotation_6d: Union[torch.Tensor, np.ndarray]) -> Union[torch
     """
     if rotation_6d.shape[-1] != 6:
         raise ValueError(f"Invalid input rotation_6d f{rotation_6d.shape}.")
-    t = Compose([rotation_6d_to_matrix])
-    return t(rotation_6d)
+    return rotation_6d_to_matrix(rotation_6d)
 
 
+@_np_to_torch_wrap
 def rotmat_to_rot6d(matrix: Union[torch.Tensor, np.ndarray]) -> Union[torch.Tensor, np.ndarray]:
     """Convert rotation matrixs to rotation 6d representations.
 
@@ -245,10 +389,10 @@ def rotmat_to_rot6d(matrix: Union[torch.Tensor, np.ndarray]) -> Union[torch.Tens
     """
     if matrix.shape[-1] != 3 or matrix.shape[-2] != 3:
         raise ValueError(f"Invalid rotation matrix  shape f{matrix.shape}.")
-    t = Compose([matrix_to_rotation_6d])
-    return t(matrix)
+    return matrix_to_rotation_6d(matrix)
 
 
+@_np_to_torch_wrap
 def rotmat_to_quat(matrix: Union[torch.Tensor, np.ndarray]) -> Union[torch.Tensor, np.ndarray]:
     """Convert rotation matrixs to quaternions.
 
@@ -260,10 +404,10 @@ def rotmat_to_quat(matrix: Union[torch.Tensor, np.ndarray]) -> Union[torch.Tenso
     """
     if matrix.shape[-1] != 3 or matrix.shape[-2] != 3:
         raise ValueError(f"Invalid rotation matrix  shape f{matrix.shape}.")
-    t = Compose([matrix_to_quaternion])
-    return t(matrix)
+    return matrix_to_quaternion(matrix)
 
 
+@_np_to_torch_wrap
 def quat_to_rotmat(quaternions: Union[torch.Tensor, np.ndarray]) -> Union[torch.Tensor, np.ndarray]:
     """Convert quaternions to rotation matrixs.
 
@@ -275,10 +419,10 @@ def quat_to_rotmat(quaternions: Union[torch.Tensor, np.ndarray]) -> Union[torch.
     """
     if quaternions.shape[-1] != 4:
         raise ValueError(f"Invalid input quaternions shape f{quaternions.shape}.")
-    t = Compose([quaternion_to_matrix])
-    return t(quaternions)
+    return quaternion_to_matrix(quaternions)
 
 
+@_np_to_torch_wrap
 def quat_to_rot6d(quaternions: Union[torch.Tensor, np.ndarray]) -> Union[torch.Tensor, np.ndarray]:
     """Convert quaternions to rotation 6d representations.
 
@@ -296,10 +440,10 @@ def quat_to_rot6d(quaternions: Union[torch.Tensor, np.ndarray]) -> Union[torch.T
     """
     if quaternions.shape[-1] != 4:
         raise ValueError(f"Invalid input quaternions f{quaternions.shape}.")
-    t = Compose([quaternion_to_matrix, matrix_to_rotation_6d])
-    return t(quaternions)
+    return _quat_to_rot6d(quaternions)
 
 
+@_np_to_torch_wrap
 def rot6d_to_quat(rotation_6d: Union[torch.Tensor, np.ndarray]) -> Union[torch.Tensor, np.ndarray]:
     """Convert rotation 6d representations to quaternions.
 
@@ -317,8 +461,7 @@ def rot6d_to_quat(rotation_6d: Union[torch.Tensor, np.ndarray]) -> Union[torch.T
     """
     if rotation_6d.shape[-1] != 6:
         raise ValueError(f"Invalid input rotation_6d shape f{rotation_6d.shape}.")
-    t = Compose([rotation_6d_to_matrix, matrix_to_quaternion])
-    return t(rotation_6d)
+    return _rot6d_to_quat(rotation_6d)
 
 
 def _rotate_smpl_pose(pose, rot):
@@ -362,68 +505,101 @@ def _construct_rotation_matrix(rot, size=3):
     return rot_mat
 
 
+@numba.jit(nopython=True, cache=True)
+def _invert_affine_2d(affine_trans):
+    # * [[M, t], [0, 1]]^-1 = [[M^-1, -M^-1 t], [0, 1]], M is 2x2
+    a, b, tx = affine_trans[0, 0], affine_trans[0, 1], affine_trans[0, 2]
+    c, d, ty = affine_trans[1, 0], affine_trans[1, 1], affine_trans[1, 2]
+    inv_det = 1.0 / (a * d - b * c)
+    inv = np.zeros((3, 3))
+    inv[0, 0] = d * inv_det
+    inv[0, 1] = -b * inv_det
+    inv[1, 0] = -c * inv_det
+    inv[1, 1] = a * inv_det
+    inv[0, 2] = -(inv[0, 0] * tx + inv[0, 1] * ty)
+    inv[1, 2] = -(inv[1, 0] * tx + inv[1, 1] * ty)
+    inv[2, 2] = 1.0
+    return inv
+
+
+@numba.jit(nopython=True, cache=True)
+def _apply_affine_2d(pts, affine_trans):
+    out = np.empty((pts.shape[0], 2))
+    for i in range(pts.shape[0]):
+        x, y = pts[i, 0], pts[i, 1]
+        out[i, 0] = affine_trans[0, 0] * x + affine_trans[0, 1] * y + affine_trans[0, 2]
+        out[i, 1] = affine_trans[1, 0] * x + affine_trans[1, 1] * y + affine_trans[1, 2]
+    return out
+
+
 def _transform_coords(pts, affine_trans, invert=False):
     """
     Args:
         pts(np.ndarray): (point_nb, 2)
     """
+    affine_trans = np.asarray(affine_trans)
+    if not (
+        affine_trans.shape == (3, 3) and affine_trans[2, 0] == 0 and affine_trans[2, 1] == 0 and affine_trans[2, 2] == 1
+    ):
+        # * not a 3x3 2d affine (e.g. a 2x3 one or a homography), keep the generic path
+        if invert:
+            affine_trans = np.linalg.inv(affine_trans)
+        hom2d = np.concatenate([pts, np.ones([np.array(pts).shape[0], 1])], 1)
+        return affine_trans.dot(hom2d.transpose()).transpose()[:, :2]
+    pts = np.asarray(pts, dtype=np.float64)
+    affine_trans = affine_trans.astype(np.float64, copy=False)
     if invert:
-        affine_trans = np.linalg.inv(affine_trans)
-    hom2d = np.concatenate([pts, np.ones([np.array(pts).shape[0], 1])], 1)
-    transformed_rows = affine_trans.dot(hom2d.transpose()).transpose()[:, :2]
-    return transformed_rows
+        affine_trans = _invert_affine_2d(affine_trans)
+    return _apply_affine_2d(np.ascontiguousarray(pts[:, :2]), affine_trans)
 
 
 def _get_affine_transform(center, scale, optical_center, out_res, rot=0):
-    rot_mat = np.zeros((3, 3))
-    sn, cs = np.sin(rot), np.cos(rot)
-    rot_mat[0, :2] = [cs, -sn]
-    rot_mat[1, :2] = [sn, cs]
-    rot_mat[2, 2] = 1
+    rot_mat = _construct_rotation_matrix(rot=rot, size=3)
+    center_hom = np.array([center[0], center[1], 1], dtype=np.float32)
     # Rotate center to obtain coordinate of center in rotated image
-    origin_rot_center = rot_mat.dot(center.tolist() + [1])[:2]
+    origin_rot_center = rot_mat.dot(center_hom)[:2]
     # Get center for transform with verts rotated around optical axis
     # (through pixel center, smthg like 128, 128 in pixels and 0,0 in 3d world)
     # For this, rotate the center but around center of image (vs 0,0 in pixel space)
-    t_mat = np.eye(3)
+    t_mat = np.eye(3, dtype=np.float32)
     t_mat[0, 2] = -optical_center[0]
     t_mat[1, 2] = -optical_center[1]
     t_inv = t_mat.copy()
     t_inv[:2, 2] *= -1
-    transformed_center = t_inv.dot(rot_mat).dot(t_mat).dot(center.tolist() + [1])
+    transformed_center = t_inv.dot(rot_mat).dot(t_mat).dot(center_hom)
     post_rot_trans = _get_affine_trans_no_rot(origin_rot_center, scale, out_res)
     total_trans = post_rot_trans.dot(rot_mat)
     # check_t = get_affine_transform_bak(center, scale, res, rot)
     # print(total_trans, check_t)
     affinetrans_post_rot = _get_affine_trans_no_rot(transformed_center[:2], scale, out_res)
-    return total_trans.astype(np.float32), affinetrans_post_rot.astype(np.float32)
+    return total_trans, affinetrans_post_rot
 
 
 def _affine_transform(center, scale, out_res, rot=0):
     rotmat = _construct_rotation_matrix(rot=rot, size=3)
     # Rotate center to obtain coordinate of center in rotated image
-    origin_rot_center = (rotmat.dot(np.concatenate([center, np.ones(1)])))[:2]
+    origin_rot_center = rotmat.dot(np.array([center[0], center[1], 1], dtype=np.float32))[:2]
 
     post_rot_trans = _get_affine_trans_no_rot(origin_rot_center, scale, out_res)
     total_trans = post_rot_trans.dot(rotmat)
-    return total_trans.astype(np.float32)
+    return total_trans
 
 
 def _affine_transform_post_rot(center, scale, optical_center, out_res, rot=0):
     rotmat = _construct_rotation_matrix(rot=rot, size=3)
-    t_mat = np.eye(3)
+    t_mat = np.eye(3, dtype=np.float32)
     t_mat[0, 2] = -optical_center[0]
     t_mat[1, 2] = -optical_center[1]
     t_inv = t_mat.copy()
     t_inv[:2, 2] *= -1
-    transformed_center = t_inv.dot(rotmat).dot(t_mat).dot(np.concatenate([center, np.ones(1)]))
+    transformed_center = t_inv.dot(rotmat).dot(t_mat).dot(np.array([center[0], center[1], 1], dtype=np.float32))
     affine_trans_post_rot = _get_affine_trans_no_rot(transformed_center[:2], scale, out_res)
 
-    return affine_trans_post_rot.astype(np.float32)
+    return affine_trans_post_rot
 
 
 def _get_affine_trans_no_rot(center, scale, res):
-    affinet = np.zeros((3, 3))
+    affinet = np.zeros((3, 3), dtype=np.float32)
     scale_ratio = float(res[0]) / float(res[1])
     affinet[0, 0] = float(res[0]) / scale
     affinet[1, 1] = float(res[1]) / scale * scale_ratio
@@ -433,22 +609,103 @@ def _get_affine_trans_no_rot(center, scale, res):
     return affinet
 
 
+def _construct_rotation_matrix_batch(rot, size=3, dtype=np.float32):
+    """Batched version of `_construct_rotation_matrix`.
+
+    Args:
+        rot (np.ndarray([N])): Rotation rad.
+        size (int): The size of the rotation matrix.
+            Candidate Values: 2, 3. Defaults to 3.
+        dtype (np.dtype): Output dtype. Defaults to np.float32.
+    Returns:
+        rot_mat (np.ndarray([N, size, size]): Rotation matrices.
+    """
+    rot = np.asarray(rot, dtype=np.float64).reshape(-1)
+    sn, cs = np.sin(rot), np.cos(rot)
+    rot_mat = np.zeros((rot.shape[0], size, size), dtype=dtype)
+    rot_mat[:, :2, :2] = np.stack([cs, -sn, sn, cs], axis=-1).reshape(-1, 2, 2)
+    if size == 3:
+        rot_mat[:, 2, 2] = 1
+    return rot_mat
+
+
+def _get_affine_trans_no_rot_batch(center, scale, res):
+    """Batched version of `_get_affine_trans_no_rot`.
+
+    Args:
+        center (np.ndarray([N, 2])): Crop centers.
+        scale (np.ndarray([N])): Crop scales.
+        res (Sequence[int]): Output resolution (w, h), shared by the batch.
+    Returns:
+        affinet (np.ndarray([N, 3, 3])): Affine matrices.
+    """
+    center = np.asarray(center, dtype=np.float32).reshape(-1, 2)
+    scale = np.broadcast_to(np.asarray(scale, dtype=np.float32).reshape(-1), center.shape[:1])
+    scale_ratio = float(res[0]) / float(res[1])
+    affinet = np.zeros((center.shape[0], 3, 3), dtype=np.float32)
+    affinet[:, 0, 0] = float(res[0]) / scale
+    affinet[:, 1, 1] = float(res[1]) / scale * scale_ratio
+    affinet[:, 0, 2] = res[0] * (-center[:, 0] / scale + 0.5)
+    affinet[:, 1, 2] = res[1] * (-center[:, 1] / scale * scale_ratio + 0.5)
+    affinet[:, 2, 2] = 1
+    return affinet
+
+
+def _get_affine_transform_batch(center, scale, optical_center, out_res, rot=0):
+    """Batched version of `_get_affine_transform`.
+
+    Args:
+        center (np.ndarray([N, 2])): Crop centers.
+        scale (np.ndarray([N])): Crop scales.
+        optical_center (np.ndarray([N, 2]) or np.ndarray([2])): Optical centers.
+        out_res (Sequence[int]): Output resolution (w, h), shared by the batch.
+        rot (np.ndarray([N]) or float): Rotation rad.
+    Returns:
+        total_trans (np.ndarray([N, 3, 3])), affinetrans_post_rot (np.ndarray([N, 3, 3]))
+    """
+    center = np.asarray(center, dtype=np.float32).reshape(-1, 2)
+    rot = np.broadcast_to(np.asarray(rot).reshape(-1), center.shape[:1])
+    optical_center = np.asarray(optical_center, dtype=np.float32).reshape(-1, 2)
+    rot_mat = _construct_rotation_matrix_batch(rot, size=2)
+    # * rotate the center around (0, 0) and around the optical center
+    origin_rot_center = np.einsum("nij,nj->ni", rot_mat, center)
+    transformed_center = np.einsum("nij,nj->ni", rot_mat, center - optical_center) + optical_center
+    post_rot_trans = _get_affine_trans_no_rot_batch(origin_rot_center, scale, out_res)
+    # * post_rot_trans @ [[R, 0], [0, 1]] only touches the upper-left block
+    total_trans = post_rot_trans.copy()
+    total_trans[:, :2, :2] = post_rot_trans[:, :2, :2] @ rot_mat
+    affinetrans_post_rot = _get_affine_trans_no_rot_batch(transformed_center, scale, out_res)
+    return total_trans, affinetrans_post_rot
+
+
+def _affine_transform_batch(center, scale, out_res, rot=0):
+    """Batched version of `_affine_transform`."""
+    return _get_affine_transform_batch(center, scale, np.zeros(2), out_res, rot)[0]
+
+
+def _affine_transform_post_rot_batch(center, scale, optical_center, out_res, rot=0):
+    """Batched version of `_affine_transform_post_rot`."""
+    return _get_affine_transform_batch(center, scale, optical_center, out_res, rot)[1]
+
+
 def fit_ortho_param(joints3d: np.ndarray, joints2d: np.ndarray) -> np.ndarray:
+    # * least squares for joints2d = f * joints3d[:, :2] + (tx, ty), shared f, per-axis shift
     joints3d_xy = joints3d[:, :2]  # (21, 2)
-    joints3d_xy = joints3d_xy.reshape(-1)[:, np.newaxis]
-    joints2d = joints2d.reshape(-1)[:, np.newaxis]
-    pad2 = np.array(range(joints2d.shape[0]))
-    pad2 = (pad2 % 2)[:, np.newaxis]
-    pad1 = 1 - pad2
-    jM = np.concatenate([joints3d_xy, pad1, pad2], axis=1)  # (42, 3)
-    jMT = jM.transpose()  # (3, 42)
-    jMTjM = np.matmul(jMT, jM)
-    jMTb = np.matmul(jMT, joints2d)
-    ortho_param = np.matmul(np.linalg.inv(jMTjM), jMTb)
-    ortho_param = ortho_param.reshape(-1)
+    mean_xy = joints3d_xy.mean(0)
+    mean_uv = joints2d.mean(0)
+    centered_xy = joints3d_xy - mean_xy
+    f = (centered_xy * (joints2d - mean_uv)).sum() / (centered_xy * centered_xy).sum()
+    tx, ty = mean_uv - f * mean_xy
+    ortho_param = np.array([f, tx, ty])
     return ortho_param  # [f, tx, ty]
 
 
+@functools.lru_cache(maxsize=32)
+def _cached_tensor(values: tuple, device: torch.device, dtype: torch.dtype) -> torch.Tensor:
+    """Small constant tensors (e.g. inp_res) shared across calls. Must not be modified in place."""
+    return torch.tensor(values, device=device, dtype=dtype)
+
+
 def batch_xyz2uvd(
     xyz: torch.Tensor,
     root_joint: torch.Tensor,
@@ -458,10 +715,10 @@ def batch_xyz2uvd(
     ref_bone_len: Optional[torch.Tensor] = None,
     camera_mode="persp",
 ) -> torch.Tensor:
-    inp_res = torch.Tensor(inp_res).to(xyz.device)  # TENSOR (2,)
+    inp_res = _cached_tensor(tuple(inp_res), xyz.device, xyz.dtype)  # TENSOR (2,)
     batch_size = xyz.shape[0]
     if ref_bone_len is None:
-        ref_bone_len = torch.ones((batch_size, 1)).to(xyz.device)  # TENSOR (B, 1)
+        ref_bone_len = torch.ones((batch_size, 1), device=xyz.device)  # TENSOR (B, 1)
 
     if camera_mode == "persp":
         assert intr.dim() == 3, f"Unexpected dim, expect intr has shape (B, 3, 3), got {intr.shape}"
@@ -473,17 +730,12 @@ def batch_xyz2uvd(
         z_ = (z - root_joint_z.expand_as(z)) / ref_bone_len.expand_as(z)  # TENSOR (B, NKP)
 
         #  2. xy_ -> uv
-        fx = intr[:, 0, 0].unsqueeze(-1)  # TENSOR (B, 1)
-        fy = intr[:, 1, 1].unsqueeze(-1)
-        cx = intr[:, 0, 2].unsqueeze(-1)
-        cy = intr[:, 1, 2].unsqueeze(-1)
-        # cat 4 TENSOR (B, 1)
-        camparam = torch.cat((fx, fy, cx, cy), dim=1)  # TENSOR (B, 4)
-        camparam = camparam.unsqueeze(1).expand(-1, xyz.shape[1], -1)  # TENSOR (B, NKP, 4)
-        uv = (xy_ * camparam[:, :, :2]) + camparam[:, :, 2:4]  # TENSOR (B, NKP, 2)
+        fxfy = intr.diagonal(dim1=-2, dim2=-1)[:, :2].unsqueeze(1)  # TENSOR (B, 1, 2)
+        cxcy = intr[:, :2, 2].unsqueeze(1)  # TENSOR (B, 1, 2)
+        uv = xy_ * fxfy + cxcy  # TENSOR (B, NKP, 2)
 
         #  3. normalize uvd to 0~1
-        uv = torch.einsum("bij, j->bij", uv, 1.0 / inp_res)  # TENSOR (B, NKP, 2), [0 ~ 1]
+        uv = uv / inp_res  # TENSOR (B, NKP, 2), [0 ~ 1]
         d = z_ / depth_range + 0.5  # TENSOR (B, NKP), [0 ~ 1]
         uvd = torch.cat((uv, d.unsqueeze(-1)), -1)  # TENSOR (B, NKP, 3)
     elif camera_mode == "ortho":
@@ -499,7 +751,7 @@ def batch_xyz2uvd(
         scale = intr[:, :1].unsqueeze(1)  # TENSOR (B, 1, 1)
         shift = intr[:, 1:].unsqueeze(1)  # TENSOR (B, 1, 2)
         uv = xy * scale + shift  # TENSOR (B, NKP, 2), [0 ~ INP_RES]
-        uv = torch.einsum("bij,j->bij", uv, 1.0 / inp_res)  # TENSOR (B, NKP, 2), [0 ~ INP_RES]
+        uv = uv / inp_res  # TENSOR (B, NKP, 2), [0 ~ INP_RES]
         uvd = torch.cat((uv, d.unsqueeze(-1)), -1)  # TENSOR (B, NKP, 3)
 
     return uvd
@@ -514,13 +766,13 @@ def batch_uvd2xyz(
     ref_bone_len: Optional[torch.Tensor] = None,
     camera_mode="persp",
 ):
-    inp_res = torch.Tensor(inp_res).to(uvd.device)
+    inp_res = _cached_tensor(tuple(inp_res), uvd.device, uvd.dtype)
     batch_size = uvd.shape[0]
     if ref_bone_len is None:
-        ref_bone_len = torch.ones((batch_size, 1)).to(uvd.device)
+        ref_bone_len = torch.ones((batch_size, 1), device=uvd.device)
 
     #  1. denormalized uvd
-    uv = torch.einsum("bij,j->bij", uvd[:, :, :2], inp_res)  # TENSOR (B, NKP, 2), [0 ~ INP_RES]
+    uv = uvd[:, :, :2] * inp_res  # TENSOR (B, NKP, 2), [0 ~ INP_RES]
     d = (uvd[:, :, 2] - 0.5) * depth_range  # TENSOR (B, NKP), [-0.2 ~ 0.2]
 
     if camera_mode == "persp":
@@ -529,15 +781,9 @@ def batch_uvd2xyz(
         z = d * ref_bone_len + root_joint_z.expand_as(uvd[:, :, 2])  # TENSOR (B, NKP)
 
         #  2. uvd->xyz
-        # camparam = torch.zeros((batch_size, 4)).float().to(uvd.device)  # TENSOR (B, 4)
-        fx = intr[:, 0, 0].unsqueeze(-1)  # TENSOR (B, 1)
-        fy = intr[:, 1, 1].unsqueeze(-1)
-        cx = intr[:, 0, 2].unsqueeze(-1)
-        cy = intr[:, 1, 2].unsqueeze(-1)
-        # cat 4 TENSOR (B, 1)
-        camparam = torch.cat((fx, fy, cx, cy), dim=1)  # TENSOR (B, 4)
-        camparam = camparam.unsqueeze(1).expand(-1, uvd.shape[1], -1)  # TENSOR (B, NKP, 4)
-        xy_ = (uv - camparam[:, :, 2:4]) / camparam[:, :, :2]  # TENSOR (B, NKP, 2)
+        fxfy = intr.diagonal(dim1=-2, dim2=-1)[:, :2].unsqueeze(1)  # TENSOR (B, 1, 2)
+        cxcy = intr[:, :2, 2].unsqueeze(1)  # TENSOR (B, 1, 2)
+        xy_ = (uv - cxcy) / fxfy  # TENSOR (B, NKP, 2)
         xy = xy_ * z.unsqueeze(-1).expand_as(uv)  # TENSOR (B, NKP, 2)
         xyz = torch.cat((xy, z.unsqueeze(-1)), -1)  # TENSOR (B, NKP, 3)
     elif camera_mode == "ortho":
@@ -563,16 +809,13 @@ def batch_ref_bone_len(joint: Union[np.ndarray, torch.Tensor], ref_bone_link=Non
     if len(joint.shape) != 3 or joint.shape[1] != 21 or joint.shape[2] != 3:
         raise TypeError("joint should have shape (B, njoint, 3), Got {}".format(joint.shape))
 
-    batch_size = joint.shape[0]
-    bone = 0
+    # * gather all bone segments at once, (B, nseg, 3)
+    ref_bone_link = list(ref_bone_link)
+    diff = joint[:, ref_bone_link[:-1], :] - joint[:, ref_bone_link[1:], :]
     if torch.is_tensor(joint):
-        bone = torch.zeros((batch_size, 1)).to(joint.device)
-        for jid, nextjid in zip(ref_bone_link[:-1], ref_bone_link[1:]):
-            bone += torch.norm(joint[:, jid, :] - joint[:, nextjid, :], dim=1, keepdim=True)  # (B, 1)
-    elif isinstance(joint, np.ndarray):
-        bone = np.zeros((batch_size, 1))
-        for jid, nextjid in zip(ref_bone_link[:-1], ref_bone_link[1:]):
-            bone += np.linalg.norm((joint[:, jid, :] - joint[:, nextjid, :]), ord=2, axis=1, keepdims=True)  # (B, 1)
+        bone = torch.norm(diff, dim=-1).sum(-1, keepdim=True)  # (B, 1)
+    else:
+        bone = np.linalg.norm(diff, ord=2, axis=-1).sum(-1, keepdims=True)  # (B, 1)
     return bone
 
 
@@ -586,12 +829,29 @@ def batch_cam_extr_transf(batch_cam_extr, batch_joints):
     Returns:
         torch.Tensor: shape (BATCH, NPERSP, NJOINTS, 3)
     """
-    res = (batch_cam_extr[..., :3, :3] @ batch_joints.transpose(2, 3)).transpose(2, 3)
-    # [B, NPERSP, 3, 3] @ [B, NPERSP, 3, 21] => [B, NPERSP, 3, 21] => [B, NPERSP, 21, 3]
-    res = res + batch_cam_extr[..., :3, 3].unsqueeze(2)
+    res = batch_joints @ batch_cam_extr[..., :3, :3].transpose(-1, -2)
+    # [B, NPERSP, 21, 3] @ [B, NPERSP, 3, 3] => [B, NPERSP, 21, 3]
+    res = res + batch_cam_extr[..., :3, 3].unsqueeze(-2)
     return res
 
 
+def batch_quat_rotate(quaternions: torch.Tensor, vectors: torch.Tensor) -> torch.Tensor:
+    """rotate one vector per quaternion without materializing rotation matrices
+
+    Args:
+        quaternions (torch.Tensor): unit quaternions (w, x, y, z), shape (..., 4)
+        vectors (torch.Tensor): shape (..., 3)
+
+    Returns:
+        torch.Tensor: shape (..., 3)
+    """
+    qw = quaternions[..., :1]
+    qv = quaternions[..., 1:]
+    # * v' = v + 2w (q x v) + 2 q x (q x v)
+    t = 2 * torch.cross(qv, vectors, dim=-1)
+    return vectors + qw * t + torch.cross(qv, t, dim=-1)
+
+
 def batch_cam_intr_projection(batch_cam_intr, batch_joints, eps=1e-7):
     """apply camera projection on batch joints with batch intrinsics
 
@@ -603,10 +863,11 @@ def batch_cam_intr_projection(batch_cam_intr, batch_joints, eps=1e-7):
     Returns:
         torch.Tensor: shape (BATCH, NPERSP, NJOINTS, 2)
     """
-    res = (batch_cam_intr @ batch_joints.transpose(2, 3)).transpose(2, 3)  # [B, NPERSP, 21, 3]
+    res = batch_joints @ batch_cam_intr.transpose(-1, -2)  # [B, NPERSP, 21, 3]
     xy = res[..., 0:2]
     z = res[..., 2:]
-    z[torch.abs(z) < eps] = eps
+    # * out-of-place so the matmul result (and autograd) is left untouched
+    z = torch.where(z.abs() < eps, torch.full_like(z, eps), z)
     uv = xy / z
     return uv
 
@@ -622,23 +883,23 @@ def batch_persp_project(verts: torch.Tensor, camintr: torch.Tensor):
         torch.Tensor: shape (B, N, 2)
     """
     # Project 3d vertices on image plane
-    verts_hom2d = camintr.bmm(verts.transpose(1, 2)).transpose(1, 2)
+    verts_hom2d = verts @ camintr.transpose(1, 2)
     proj_verts2d = verts_hom2d[:, :, :2] / verts_hom2d[:, :, 2:]
     return proj_verts2d
 
 
-def persp_project(points3d, cam_intr):
-    hom_2d = np.array(cam_intr).dot(points3d.transpose()).transpose()
-    points2d = (hom_2d / (hom_2d[:, 2:] + 1e-6))[:, :2]
-    return points2d.astype(np.float32)
+def persp_project(points3d, cam_intr, eps=1e-6):
+    hom_2d = points3d @ np.asarray(cam_intr).T
+    z = hom_2d[:, 2:]
+    z = np.where(np.abs(z) < eps, eps, z)
+    points2d = hom_2d[:, :2] / z
+    return points2d.astype(np.float32, copy=False)
 
 
 def ortho_project(points3d, ortho_cam):
-    x, y = points3d[:, 0], points3d[:, 1]
-    u = ortho_cam[0] * x + ortho_cam[1]
-    v = ortho_cam[0] * y + ortho_cam[2]
-    u_, v_ = u[:, np.newaxis], v[:, np.newaxis]
-    return np.concatenate([u_, v_], axis=1)
+    # * [f, tx, ty], the same scale for both axes; the offsets take the dtype of the points so that
+    # * a list ortho_cam does not promote float32 points to float64
+    return ortho_cam[0] * points3d[:, :2] + np.asarray(ortho_cam[1:3], dtype=points3d.dtype)
 
 
 # * >>>>>>>>>>
@@ -697,24 +958,19 @@ def perspective_projection(points, rotation, translation, focal_length, camera_c
         focal_length (bs,) or scalar: Focal length
         camera_center (bs, 2): Camera center
     """
-    batch_size = points.shape[0]
-    K = torch.zeros([batch_size, 3, 3], device=points.device)
-    K[:, 0, 0] = focal_length
-    K[:, 1, 1] = focal_length
-    K[:, 2, 2] = 1.0
-    K[:, :-1, -1] = camera_center
-
     # Transform points
-    points = torch.einsum("bij,bkj->bki", rotation, points)
+    points = points @ rotation.transpose(-1, -2)
     points = points + translation.unsqueeze(1)
 
     # Apply perspective distortion
-    projected_points = points / points[:, :, -1].unsqueeze(-1)
+    projected_points = points[:, :, :-1] / points[:, :, -1:]
 
-    # Apply camera intrinsics
-    projected_points = torch.einsum("bij,bkj->bki", K, projected_points)
+    # Apply camera intrinsics, K = [[f, 0, cx], [0, f, cy], [0, 0, 1]]
+    focal_length = torch.as_tensor(focal_length, dtype=points.dtype, device=points.device).reshape(-1, 1, 1)
+    camera_center = torch.as_tensor(camera_center, dtype=points.dtype, device=points.device).reshape(-1, 1, 2)
+    projected_points = projected_points * focal_length + camera_center
 
-    return projected_points[:, :, :-1]
+    return projected_points
 
 
 def weak_perspective_projection(points, rotation, weak_cam_params, focal_length, camera_center, img_res):
@@ -727,26 +983,21 @@ def weak_perspective_projection(points, rotation, weak_cam_params, focal_length,
         focal_length (bs,) or scalar: Focal length
         camera_center (bs, 2): Camera center
     """
-    batch_size = points.shape[0]
-    K = torch.zeros([batch_size, 3, 3], device=points.device)
-    K[:, 0, 0] = focal_length
-    K[:, 1, 1] = focal_length
-    K[:, 2, 2] = 1.0
-    K[:, :-1, -1] = camera_center
-
     translation = convert_weak_perspective_to_perspective(weak_cam_params, focal_length, img_res)
 
     # Transform points
-    points = torch.einsum("bij,bkj->bki", rotation, points)
+    points = points @ rotation.transpose(-1, -2)
     points = points + translation.unsqueeze(1)
 
     # Apply perspective distortion
-    projected_points = points / points[:, :, -1].unsqueeze(-1)
+    projected_points = points[:, :, :-1] / points[:, :, -1:]
 
-    # Apply camera intrinsics
-    projected_points = torch.einsum("bij,bkj->bki", K, projected_points)
+    # Apply camera intrinsics, K = [[f, 0, cx], [0, f, cy], [0, 0, 1]]
+    focal_length = torch.as_tensor(focal_length, dtype=points.dtype, device=points.device).reshape(-1, 1, 1)
+    camera_center = torch.as_tensor(camera_center, dtype=points.dtype, device=points.device).reshape(-1, 1, 2)
+    projected_points = projected_points * focal_length + camera_center
 
-    return projected_points[:, :, :-1]
+    return projected_points
 
 
 # * <<<<<<<<<<
@@ -754,36 +1005,33 @@ def weak_perspective_projection(points, rotation, weak_cam_params, focal_length,
 
 # visible in raw image
 def get_verts_2d_vis(verts_2d=None, raw_size=None, **kwargs):
-    verts_vis = ((verts_2d[:, 0] >= 0) & (verts_2d[:, 0] < raw_size[0])) & (
-        (verts_2d[:, 1] >= 0) & (verts_2d[:, 1] < raw_size[1])
-    )
+    verts_2d = verts_2d[:, :2]
+    verts_vis = ((verts_2d >= 0) & (verts_2d < np.asarray(raw_size[:2]))).all(axis=-1)
     return verts_vis.astype(np.float32)
 
 
+def _annot_bounds(annots, visibility=None):
+    """(min_xy, max_xy) of the (visible) 2d annotations, shared by get_annot_scale / get_annot_center"""
+    if visibility is not None:
+        annots = annots[visibility]
+    return annots.min(0), annots.max(0)
+
+
 def get_annot_scale(annots, visibility=None, scale_factor=1.0):
     """
     Retreives the size of the square we want to crop by taking the
     maximum of vertical and horizontal span of the hand and multiplying
     it by the scale_factor to add some padding around the hand
     """
-    if visibility is not None:
-        annots = annots[visibility]
-    min_x, min_y = annots.min(0)
-    max_x, max_y = annots.max(0)
-    delta_x = max_x - min_x
-    delta_y = max_y - min_y
-    max_delta = max(delta_x, delta_y)
+    min_xy, max_xy = _annot_bounds(annots, visibility)
+    max_delta = (max_xy - min_xy).max()
     s = max_delta * scale_factor
     return s
 
 
 def get_annot_center(annots, visibility=None):
-    if visibility is not None:
-        annots = annots[visibility]
-    min_x, min_y = annots.min(0)
-    max_x, max_y = annots.max(0)
-    c_x = int((max_x + min_x) / 2)
-    c_y = int((max_y + min_y) / 2)
+    min_xy, max_xy = _annot_bounds(annots, visibility)
+    c_x, c_y = ((max_xy + min_xy) / 2).astype(int)
     return np.asarray([c_x, c_y])
 
 
@@ -812,7 +1060,11 @@ def bbox_xywh_to_xyxy(xywh):
     elif isinstance(xywh, np.ndarray):
         if not xywh.size % 4 == 0:
             raise IndexError("Bounding boxes must have n * 4 elements, given {}".format(xywh.shape))
-        xyxy = np.hstack((xywh[:, :2], xywh[:, :2] + np.maximum(0, xywh[:, 2:4] - 1)))
+        xyxy = np.empty_like(xywh[:, :4])
+        xyxy[:, :2] = xywh[:, :2]
+        np.subtract(xywh[:, 2:4], 1, out=xyxy[:, 2:4])
+        np.maximum(xyxy[:, 2:4], 0, out=xyxy[:, 2:4])
+        xyxy[:, 2:4] += xywh[:, :2]
         return xyxy
     else:
         raise TypeError("Expect input xywh a list, tuple or numpy.ndarray, given {}".format(type(xywh)))
@@ -844,7 +1096,11 @@ def bbox_xyxy_to_xywh(xyxy):
     elif isinstance(xyxy, np.ndarray):
         if not xyxy.size % 4 == 0:
             raise IndexError("Bounding boxes must have n * 4 elements, given {}".format(xyxy.shape))
-        return np.hstack((xyxy[:, :2], xyxy[:, 2:4] - xyxy[:, :2] + 1))
+        xywh = np.empty_like(xyxy[:, :4])
+        xywh[:, :2] = xyxy[:, :2]
+        np.subtract(xyxy[:, 2:4], xyxy[:, :2], out=xywh[:, 2:4])
+        xywh[:, 2:4] += 1
+        return xywh
     else:
         raise TypeError("Expect input xywh a list, tuple or numpy.ndarray, given {}".format(type(xyxy)))
 
@@ -870,6 +1126,42 @@ def center_scale_to_box(center, scale):
     return bbox
 
 
+def center_scale_to_box_batch(centers, scales):
+    """Batched version of `center_scale_to_box`.
+
+    Args:
+        centers (np.ndarray): (N, 2) bbox centers (x, y)
+        scales (np.ndarray): (N,) side lengths of the square bboxes
+
+    Returns:
+        np.ndarray: (N, 4) bboxes in xmin, ymin, xmax, ymax.
+    """
+    centers = np.asarray(centers)
+    scales = np.asarray(scales).reshape(-1, 1)
+    bbox = np.empty((centers.shape[0], 4), dtype=np.result_type(centers, scales))
+    np.subtract(centers[:, :2], scales * 0.5, out=bbox[:, :2])
+    np.add(bbox[:, :2], scales, out=bbox[:, 2:])
+    return bbox
+
+
+def _is_flat_seq(x):
+    return isinstance(x, (list, tuple)) and all(isinstance(v, (int, float)) for v in x)
+
+
+@functools.lru_cache(maxsize=32)
+def _meanstd(mean, std, device: torch.device, dtype: torch.dtype):
+    """mean / std as (C, 1, 1) tensors for denormalize; cached for constant sequences. Must not be modified in place."""
+    mean = torch.as_tensor(mean, dtype=dtype, device=device)
+    std = torch.as_tensor(std, dtype=dtype, device=device)
+    if (std == 0).any():
+        raise ValueError("std evaluated to zero after conversion to {}, leading to division by zero.".format(dtype))
+    if mean.ndim == 1:
+        mean = mean.view(-1, 1, 1)
+    if std.ndim == 1:
+        std = std.view(-1, 1, 1)
+    return mean, std
+
+
 def denormalize(tensor, mean, std, inplace=False):
     if not isinstance(tensor, torch.Tensor):
         raise TypeError("Input tensor should be a torch tensor. Got {}.".format(type(tensor)))
@@ -881,15 +1173,11 @@ def denormalize(tensor, mean, std, inplace=False):
         )
 
     dtype = tensor.dtype
-    mean = torch.as_tensor(mean, dtype=dtype, device=tensor.device)
-    std = torch.as_tensor(std, dtype=dtype, device=tensor.device)
-    if (std == 0).any():
-        raise ValueError("std evaluated to zero after conversion to {}, leading to division by zero.".format(dtype))
-    if mean.ndim == 1:
-        mean = mean.view(-1, 1, 1)
-    if std.ndim == 1:
-        std = std.view(-1, 1, 1)
-    tensor.mul_(std).sub_(-1 * mean)
+    if _is_flat_seq(mean) and _is_flat_seq(std):
+        mean, std = _meanstd(tuple(mean), tuple(std), tensor.device, dtype)
+    else:
+        mean, std = _meanstd.__wrapped__(mean, std, tensor.device, dtype)
+    tensor.mul_(std).add_(mean)
     return tensor
 
 
@@ -900,7 +1188,7 @@ def bhwc_2_bchw(tensor):
     """
     if not torch.is_tensor(tensor) or tensor.ndimension() != 4:
         raise TypeError("invalid tensor or tensor channel is not BCHW")
-    return tensor.unsqueeze(1).transpose(1, -1).squeeze(-1)
+    return tensor.permute(0, 3, 1, 2)
 
 
 def bchw_2_bhwc(tensor):
@@ -910,7 +1198,7 @@ def bchw_2_bhwc(tensor):
     """
     if not torch.is_tensor(tensor) or tensor.ndimension() != 4:
         raise TypeError("invalid tensor or tensor channel is not BCHW")
-    return tensor.unsqueeze(-1).transpose(1, -1).squeeze(1)
+    return tensor.permute(0, 2, 3, 1)
 
 
 def to_homogeneous_transf(rot, tsl):
@@ -929,21 +1217,37 @@ def to_homogeneous_transf(rot, tsl):
         raise TypeError("invalid tensor dimension")
     if tsl.shape[1] != 3:
         raise TypeError("invalid tensor dimension")
-    tsl = tsl.unsqueeze(-1)
-    transf = torch.cat((rot, tsl), dim=-1)
-    transf = torch.cat(
-        (transf, torch.tensor([0, 0, 0, 1], device=rot.device).view(1, 1, 4).repeat(rot.shape[0], 1, 1)), dim=1
-    )
+    transf = rot.new_zeros((rot.shape[0], 4, 4))
+    transf[:, :3, :3] = rot
+    transf[:, :3, 3] = tsl
+    transf[:, 3, 3] = 1
     return transf
 
 
+@numba.jit(nopython=True, cache=True)
+def _vert_bbox_center(vertices):
+    # * min and max in one pass over the (V, 3) vertices
+    vmin = vertices[0].copy()
+    vmax = vertices[0].copy()
+    for i in range(1, vertices.shape[0]):
+        for j in range(vertices.shape[1]):
+            v = vertices[i, j]
+            if v < vmin[j]:
+                vmin[j] = v
+            elif v > vmax[j]:
+                vmax[j] = v
+    return (vmin + vmax) / 2
+
+
 def center_vert_bbox(vertices, bbox_center=None, bbox_scale=None, scale=False):
     if bbox_center is None:
-        bbox_center = (vertices.min(0) + vertices.max(0)) / 2
+        bbox_center = _vert_bbox_center(np.ascontiguousarray(vertices))
     vertices = vertices - bbox_center
     if scale:
         if bbox_scale is None:
-            bbox_scale = np.linalg.norm(vertices, 2, 1).max()
+            # * one sqrt on the max squared radius instead of a per-vertex norm
+            bbox_scale = np.sqrt(np.einsum("ij,ij->i", vertices, vertices).max())
+        # * out of place: an int vertices - bbox_center can not hold the true divide
         vertices = vertices / bbox_scale
     else:
         bbox_scale = 1
@@ -951,89 +1255,152 @@ def center_vert_bbox(vertices, bbox_center=None, bbox_scale=None, scale=False):
 
 
 def generate_rand_transf(batch_size, r_angle=np.pi / 2, r_tsl=0.1, device="cpu"):
-    rot = R.random(batch_size).as_rotvec()
-    rot = rot / np.linalg.norm(rot, axis=1, keepdims=True)
-    angle = np.random.rand(batch_size) * (r_angle * 2) - r_angle  # angle between -r_angle and r_angle
-    rot = rot * angle[:, None]
-
-    rot = torch.from_numpy(rot).float().to(device)
-    rot = aa_to_rotmat(rot)
+    # * normalized gaussian samples are uniform on the sphere, no scipy / host round trip
+    axis = torch.randn(batch_size, 3, device=device)
+    axis = axis / axis.norm(dim=1, keepdim=True)
+    angle = torch.rand(batch_size, device=device) * (r_angle * 2) - r_angle  # angle between -r_angle and r_angle
+    rot = aa_to_rotmat(axis * angle[:, None])
 
-    tsl = torch.rand(batch_size, 3).float().to(device) * r_tsl * 2 - r_tsl  # tsl between -r_tsl and r_tsl
+    tsl = torch.rand(batch_size, 3, device=device) * r_tsl * 2 - r_tsl  # tsl between -r_tsl and r_tsl
 
-    transf = torch.cat([rot, tsl[:, :, None]], dim=2)
-    transf = torch.cat(
-        [
-            transf,
-            torch.tensor([0, 0, 0, 1], dtype=torch.float32).to(device)[None, None, :].repeat(batch_size, 1, 1),
-        ],
-        dim=1,
-    )
+    transf = to_homogeneous_transf(rot, tsl)
     return transf
 
 
-def caculate_align_mat(p1, p2):
-    vec = p2 - p1
-    vec = vec / np.linalg.norm(vec)
-    z_unit_Arr = np.array([0, 0, 1])
-
-    z_mat = np.array(
+@numba.jit(nopython=True, cache=True)
+def _align_mat_single(vec, eps):
+    vec = vec / np.sqrt((vec * vec).sum())
+    vx, vy, c = vec[0], vec[1], vec[2]
+    if 1 + c < eps:
+        return np.diag(np.array([1.0, -1.0, -1.0]))
+    k = 1 / (1 + c)
+    return np.array(
         [
-            [0, -z_unit_Arr[2], z_unit_Arr[1]],
-            [z_unit_Arr[2], 0, -z_unit_Arr[0]],
-            [-z_unit_Arr[1], z_unit_Arr[0], 0],
+            [1 - vx * vx * k, -vx * vy * k, vx],
+            [-vx * vy * k, 1 - vy * vy * k, vy],
+            [-vx, -vy, c],
         ]
     )
 
-    z_c_vec = np.matmul(z_mat, vec)
-    z_c_vec_mat = np.array(
-        [
-            [0, -z_c_vec[2], z_c_vec[1]],
-            [z_c_vec[2], 0, -z_c_vec[0]],
-            [-z_c_vec[1], z_c_vec[0], 0],
-        ]
-    )
-
-    if np.dot(z_unit_Arr, vec) == -1:
-        qTrans_Mat = -np.eye(3, 3)
-    elif np.dot(z_unit_Arr, vec) == 1:
-        qTrans_Mat = np.eye(3, 3)
-    else:
-        qTrans_Mat = np.eye(3, 3) + z_c_vec_mat + np.matmul(z_c_vec_mat, z_c_vec_mat) / (1 + np.dot(z_unit_Arr, vec))
 
+def caculate_align_mat(p1, p2, eps=1e-8):
+    """Rotation taking +z onto the direction p2 - p1, for (3,) or batched (..., 3) points."""
+    vec = p2 - p1
+    if vec.ndim == 1:
+        # * jitted scalar path for per-frame callers
+        return _align_mat_single(vec.astype(np.float64), eps)
+    vec = vec / np.linalg.norm(vec, axis=-1, keepdims=True)
+    # * Rodrigues with axis z x vec = (-vy, vx, 0) and cos = vz: R = I + K + K @ K / (1 + cos)
+    vx, vy, c = vec[..., 0], vec[..., 1], vec[..., 2]
+    k = 1 / np.maximum(1 + c, eps)
+    qTrans_Mat = np.empty(vec.shape[:-1] + (3, 3))
+    qTrans_Mat[..., 0, 0] = 1 - vx * vx * k
+    qTrans_Mat[..., 0, 1] = -vx * vy * k
+    qTrans_Mat[..., 0, 2] = vx
+    qTrans_Mat[..., 1, 0] = -vx * vy * k
+    qTrans_Mat[..., 1, 1] = 1 - vy * vy * k
+    qTrans_Mat[..., 1, 2] = vy
+    qTrans_Mat[..., 2, 0] = -vx
+    qTrans_Mat[..., 2, 1] = -vy
+    qTrans_Mat[..., 2, 2] = c
+    # * antiparallel: any half turn about an axis perpendicular to z, here x
+    qTrans_Mat = np.where((1 + c < eps)[..., None, None], np.diag([1.0, -1.0, -1.0]), qTrans_Mat)
     return qTrans_Mat
 
 
-def slerp_and_lerp_pose(matrix1, matrix2, t):
-    rotation1 = matrix1[:3, :3]
-    rotation2 = matrix2[:3, :3]
-
-    translation1 = matrix1[:3, 3]
-    translation2 = matrix2[:3, 3]
-
-    slerp = Slerp([0, 1], R.concatenate([R.from_matrix(rotation1), R.from_matrix(rotation2)]))
-
-    slerp_rotation = slerp(t).as_matrix()  # [t, 3, 3]
-
-    lerp_translation = []
-    for i in t:
-        lerp_t = (1 - i) * translation1 + i * translation2  # [3]
-        lerp_translation.append(lerp_t)
-    lerp_translation = np.stack(lerp_translation, axis=0)  # [t, 3]
+def batch_slerp(
+    q0: torch.Tensor, q1: torch.Tensor, t: Union[torch.Tensor, float], eps: float = 1e-6, fast: bool = False
+) -> torch.Tensor:
+    """Spherical linear interpolation between batches of unit quaternions.
 
-    result = np.eye(4)[None].repeat(len(t), axis=0)  # [t, 4, 4]
-    result[:, :3, :3] = slerp_rotation
-    result[:, :3, 3] = lerp_translation
+    Args:
+        q0 (torch.Tensor): (..., 4) start quaternions.
+        q1 (torch.Tensor): (..., 4) end quaternions.
+        t (torch.Tensor or float): interpolation factor, broadcastable to q0.shape[:-1].
+        eps (float): below this sin(theta), fall back to normalized lerp.
+        fast (bool, optional): use the polynomial-corrected nlerp ("fnlerp") approximation,
+                no acos / sin. Defaults to False.
 
-    return result.astype(np.float32)
+    Returns:
+        torch.Tensor: (..., 4) interpolated unit quaternions.
+    """
+    t = torch.as_tensor(t, dtype=q0.dtype, device=q0.device).unsqueeze(-1)
+    dot = (q0 * q1).sum(-1, keepdim=True)
+    # * take the short path: q and -q are the same rotation
+    q1 = torch.where(dot < 0, -q1, q1)
+    dot = dot.abs().clamp(max=1.0)
+    if fast:
+        # * warp t so that nlerp follows slerp's constant angular velocity
+        k = 0.931872 + dot * (-1.25654 + dot * 0.331442)
+        t = t + t * (t - 0.5) * (t - 1) * k
+        q = torch.lerp(q0, q1, t)
+        # * the blend of two short-path unit quaternions never vanishes, so no eps clamp is needed
+        return q * torch.rsqrt((q * q).sum(-1, keepdim=True))
+    theta = torch.acos(dot)
+    sin_theta = torch.sin(theta)
+    slerp = (torch.sin((1 - t) * theta) * q0 + torch.sin(t * theta) * q1) / sin_theta.clamp(min=eps)
+    lerp = F.normalize((1 - t) * q0 + t * q1, dim=-1)
+    return torch.where(sin_theta < eps, lerp, slerp)
+
+
+def slerp_and_lerp_pose(matrix1, matrix2, t, fast=False):
+    t = torch.as_tensor(np.asarray(t), dtype=torch.float64)  # [t]
+    matrix1 = torch.as_tensor(matrix1, dtype=torch.float64)
+    matrix2 = torch.as_tensor(matrix2, dtype=torch.float64)
+
+    # * both keyframes in one closed-form matrix -> quaternion call, no rotation objects
+    quats = matrix_to_quaternion(torch.stack((matrix1[:3, :3], matrix2[:3, :3])))  # [2, 4]
+    quat1, quat2 = quats[:, None].expand(2, len(t), 4)
+    slerp_rotation = quaternion_to_matrix(batch_slerp(quat1, quat2, t, fast=fast))  # [t, 3, 3]
+    lerp_translation = torch.lerp(matrix1[:3, 3], matrix2[:3, 3], t[:, None])  # [t, 3]
+
+    result = np.zeros((len(t), 4, 4), dtype=np.float32)  # [t, 4, 4]
+    result[:, :3, :3] = slerp_rotation.numpy()
+    result[:, :3, 3] = lerp_translation.numpy()
+    result[:, 3, 3] = 1
+
+    return result
+
+
+def _signed_dist(
+    points,
+    points_near,
+    near_normals: Optional[torch.Tensor] = None,
+    out: Optional[torch.Tensor] = None,
+):
+    """offsets (N, P, 3) from the nearest points, and their norms signed by the nearest normals (N, P)"""
+    # * out: optional preallocated (N, P, 3) buffer, reused across calls instead of a fresh offset tensor;
+    # * out= ops are not differentiable, so it is ignored whenever autograd has to record the offsets
+    needs_grad = torch.is_grad_enabled() and (points.requires_grad or points_near.requires_grad)
+    if out is not None and not needs_grad:
+        offset = torch.sub(points, points_near, out=out)
+    else:
+        offset = points - points_near
+    dist = torch.linalg.vector_norm(offset, dim=2)
+    if near_normals is not None:
+        dist = torch.copysign(dist, (near_normals * offset).sum(-1))
+    return offset, dist
 
 
 class P2PSigned(nn.Module):
-    def __init__(self) -> None:
+    def __init__(self, backend="knn") -> None:
+        """
+        Args:
+            backend: "knn" uses pytorch3d's knn_points, which returns the nearest points along with
+                their indices; "chamfer" uses the chamfer_distance extension and gathers them afterwards.
+        """
         super().__init__()
-        import chamfer_distance as chd
+        if backend not in ("knn", "chamfer"):
+            raise ValueError(f"Unknown P2PSigned backend: {backend}")
+        self.backend = backend
+        if backend == "knn":
+            from pytorch3d.ops import knn_points
+
+            self.knn_points = knn_points
+        else:
+            import chamfer_distance as chd
 
-        self.ch_dist = chd.ChamferDistance()
+            self.ch_dist = chd.ChamferDistance()
 
     def forward(
         self,
@@ -1042,6 +1409,7 @@ class P2PSigned(nn.Module):
         x_normals=None,
         y_normals=None,
         return_vector=False,
+        buf=None,
     ):
         """
         signed distance between two pointclouds
@@ -1055,6 +1423,10 @@ class P2PSigned(nn.Module):
                 dimension D.
             x_normals: Optional FloatTensor of shape (N, P1, D).
             y_normals: Optional FloatTensor of shape (N, P2, D).
+            buf: Optional tuple of preallocated FloatTensors of shape (N, P1, D) and (N, P2, D)
+                receiving the x2y and y2x offsets, to be reused across iterations. Only used when no
+                gradient is required (otherwise fresh tensors are returned); when used, the returned
+                x2y / y2x are these buffers and are overwritten by the next call reusing them.
 
         Returns:
 
@@ -1073,33 +1445,44 @@ class P2PSigned(nn.Module):
         if y.shape[0] != N or y.shape[2] != D:
             raise ValueError("y does not have the correct shape.")
 
-        x_near, y_near, xidx_near, yidx_near = self.ch_dist(x, y)
-
-        xidx_near_expanded = xidx_near.view(N, P1, 1).expand(N, P1, D).to(torch.long)
-        x_near = y.gather(1, xidx_near_expanded)
-
-        yidx_near_expanded = yidx_near.view(N, P2, 1).expand(N, P2, D).to(torch.long)
-        y_near = x.gather(1, yidx_near_expanded)
+        if self.backend == "knn":
+            # * the kernel hands back the nearest points, so only the normals need a gather
+            x_knn = self.knn_points(x, y, K=1, return_nn=True)
+            y_knn = self.knn_points(y, x, K=1, return_nn=True)
+            xidx_near, x_near = x_knn.idx[..., 0], x_knn.knn[:, :, 0]
+            yidx_near, y_near = y_knn.idx[..., 0], y_knn.knn[:, :, 0]
+            xidx_near_expanded = xidx_near.view(N, P1, 1).expand(N, P1, D)
+            yidx_near_expanded = yidx_near.view(N, P2, 1).expand(N, P2, D)
+        else:
+            x_near, y_near, xidx_near, yidx_near = self.ch_dist(x, y)
 
-        x2y = x - x_near  # y point to x
-        y2x = y - y_near  # x point to y
+            # * cast before expanding, so that .to() never materializes the (N, P, D) index
+            xidx_near_expanded = xidx_near.to(torch.long).view(N, P1, 1).expand(N, P1, D)
+            x_near = y.gather(1, xidx_near_expanded)
 
-        if x_normals is not None:
-            y_nn = x_normals.gather(1, yidx_near_expanded)
-            in_out = torch.bmm(y_nn.reshape(-1, 1, 3), y2x.reshape(-1, 3, 1)).view(N, -1).sign()
-            y2x_signed = y2x.norm(dim=2) * in_out
+            yidx_near_expanded = yidx_near.to(torch.long).view(N, P2, 1).expand(N, P2, D)
+            y_near = x.gather(1, yidx_near_expanded)
 
-        else:
-            y2x_signed = y2x.norm(dim=2)
-
-        if y_normals is not None:
-            x_nn = y_normals.gather(1, xidx_near_expanded)
-            in_out_x = torch.bmm(x_nn.reshape(-1, 1, 3), x2y.reshape(-1, 3, 1)).view(N, -1).sign()
-            x2y_signed = x2y.norm(dim=2) * in_out_x
-        else:
-            x2y_signed = x2y.norm(dim=2)
+        x2y_buf, y2x_buf = (None, None) if buf is None else buf
+        x_nn = None if y_normals is None else y_normals.gather(1, xidx_near_expanded)
+        x2y, x2y_signed = _signed_dist(x, x_near, x_nn, out=x2y_buf)  # y point to x
+        y_nn = None if x_normals is None else x_normals.gather(1, yidx_near_expanded)
+        y2x, y2x_signed = _signed_dist(y, y_near, y_nn, out=y2x_buf)  # x point to y
 
         if not return_vector:
             return y2x_signed, x2y_signed, yidx_near, xidx_near
         else:
             return y2x_signed, x2y_signed, yidx_near, xidx_near, y2x, x2y
+
+
+# * opt-in torch.compile of the tensor-only hot paths, e.g. TORCH_COMPILE_XFORMS=1
+if os.environ.get("TORCH_COMPILE_XFORMS", "0") == "1" and hasattr(torch, "compile"):
+    # * default mode rather than reduce-overhead: cudagraph outputs are recycled across calls,
+    # * which is unsafe for free functions whose results callers keep around
+    batch_xyz2uvd = torch.compile(batch_xyz2uvd)
+    batch_uvd2xyz = torch.compile(batch_uvd2xyz)
+    batch_cam_extr_transf = torch.compile(batch_cam_extr_transf)
+    batch_cam_intr_projection = torch.compile(batch_cam_intr_projection)
+    perspective_projection = torch.compile(perspective_projection)
+    _axis_angle_to_matrix = torch.compile(_axis_angle_to_matrix)
+    _signed_dist = torch.compile(_signed_dist)
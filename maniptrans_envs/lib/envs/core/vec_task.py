@@ -29,7 +29,7 @@ import os
 import time
 from datetime import datetime
 from os.path import join
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Optional, Tuple
 
 import gym
 from gym import spaces
@@ -40,6 +40,7 @@ from ...utils.dr_utils import (
     get_property_getter_map,
     get_default_setter_args,
     apply_random_samples,
+    apply_random_samples_list,
     check_buckets,
     generate_random_samples,
 )
@@ -48,7 +49,7 @@ from ...utils.cv2_display import Cv2Display
 import torch
 import numpy as np
 import operator, random
-from copy import deepcopy
+from copy import copy, deepcopy
 
 import sys
 
@@ -59,6 +60,10 @@ import torchvision
 
 EXISTING_SIM = None
 SCREEN_CAPTURE_RESOLUTION = (1027, 768)
+SQRT_3 = float(np.sqrt(3.0))  # half-width of the zero-mean, unit-variance uniform
+# physx options whose config value has to be wrapped into a gymapi type
+_PHYSX_CONVERTERS = {"contact_collection": gymapi.ContactCollection}
+_LIST_ACTOR_PROPS = ("rigid_body_properties", "rigid_shape_properties", "tendon_properties")
 
 
 def _create_sim_once(gym, *args, **kwargs):
@@ -70,11 +75,46 @@ def _create_sim_once(gym, *args, **kwargs):
         return EXISTING_SIM
 
 
-def save_getattr(obj, attr):
+_IMMUTABLE_TYPES = (bool, int, float, complex, str, bytes, type(None))
+
+
+def save_getattr(obj, attr, deep=False):
+    """Snapshot `obj.attr` without the cost of a deepcopy for the common cases."""
+    value = getattr(obj, attr)
+    if isinstance(value, _IMMUTABLE_TYPES):
+        return value
+    if isinstance(value, torch.Tensor):
+        return value.clone()
+    if isinstance(value, np.ndarray):
+        return value.copy()
+    # * isaac gym (pybind) values such as Vec3 hold no nested python objects, a shallow copy detaches them;
+    # * containers may, so they keep the deepcopy
     try:
-        return deepcopy(getattr(obj, attr))
+        return deepcopy(value) if deep or isinstance(value, (list, tuple, dict)) else copy(value)
     except:
-        return getattr(obj, attr)
+        return value
+
+
+@torch.jit.script
+def compute_timeout(progress_buf: torch.Tensor, reset_buf: torch.Tensor, max_episode_length: int) -> torch.Tensor:
+    # set to 1 if we reached the max episode length AND the reset buffer is 1
+    return (progress_buf >= max_episode_length - 1) & (reset_buf != 0)
+
+
+@torch.jit.script
+def compute_gaussian_noise(
+    noise: torch.Tensor, corr: torch.Tensor, mu: float, var: float, mu_corr: float, var_corr: float
+) -> torch.Tensor:
+    # correlated term (fixed draw) + per-call term (fresh standard normal draw)
+    return corr * var_corr + mu_corr + noise * var + mu
+
+
+@torch.jit.script
+def compute_uniform_noise(
+    noise: torch.Tensor, corr: torch.Tensor, lo: float, hi: float, lo_corr: float, hi_corr: float
+) -> torch.Tensor:
+    # correlated term (fixed draw) + per-call term (fresh [0, 1) uniform draw)
+    return corr * (hi_corr - lo_corr) + lo_corr + noise * (hi - lo) + lo
 
 
 class Env(ABC):
@@ -154,10 +194,16 @@ class Env(ABC):
         self.num_actions = config["env"]["numActions"]
         self.control_freq_inv = config["env"].get("controlFrequencyInv", 1)
 
-        self.act_space = spaces.Box(np.ones(self.num_actions) * -1.0, np.ones(self.num_actions) * 1.0)
+        self.act_space = spaces.Box(
+            np.full(self.num_actions, -1.0, dtype=np.float32),
+            np.full(self.num_actions, 1.0, dtype=np.float32),
+        )
 
         self.clip_obs = config["env"].get("clipObservations", np.Inf)
         self.clip_actions = config["env"].get("clipActions", np.Inf)
+        # * clamping to +-inf is a plain copy, skip it
+        self._needs_obs_clip = bool(np.isfinite(self.clip_obs))
+        self._needs_action_clip = bool(np.isfinite(self.clip_actions))
 
         # Total number of training frames since the beginning of the experiment.
         # We get this information from the learning algorithm rather than tracking ourselves.
@@ -291,6 +337,8 @@ class VecTask(Env):
             raise ValueError(msg)
 
         self.dt: float = self.sim_params.dt
+        # render at control frequency (every control step) unless a render fps is given
+        self._render_dt: float = self.dt * self.control_freq_inv if self.render_fps < 0 else 1.0 / self.render_fps
 
         self.sim_params.physx.max_gpu_contact_pairs = int(
             2 * self.sim_params.physx.max_gpu_contact_pairs
@@ -308,12 +356,12 @@ class VecTask(Env):
         self.randomize = self.cfg["task"]["randomize"]
         self.original_props = {}
         self.dr_randomizations = self.cfg["task"]["randomization_params"] if self.randomize else {}
+        self._dr_generators = {}  # * device -> generator for the per-step observation / action noise
         self.actor_params_generator = None
-        self.extern_actor_params = {}
+        self.extern_actor_params = dict.fromkeys(range(self.num_envs))
+        self._actor_handle_table = {}
         self.last_step = -1
         self.last_rand_step = -1
-        for env_id in range(self.num_envs):
-            self.extern_actor_params[env_id] = None
 
         self.camera_handlers = [] if (display or record) else None
         self.camera_obs = [] if (display or record) else None
@@ -339,6 +387,10 @@ class VecTask(Env):
                         self.gym.get_camera_image_gpu_tensor(self.sim, env, handle, gymapi.IMAGE_COLOR)
                     )
                 )
+            # * the per-env images live in isaac gym's own buffers, so render gathers them into this one
+            if len(self.camera_obs) > 0:
+                img = self.camera_obs[0]
+                self._cam_batch = torch.empty((len(self.camera_obs), *img.shape), dtype=img.dtype, device=img.device)
 
     @staticmethod
     def create_camera(
@@ -414,7 +466,8 @@ class VecTask(Env):
         self.rew_buf = torch.zeros(self.num_envs, device=self.device, dtype=torch.float)
         self.total_rew_buf = torch.zeros(self.num_envs, device=self.device, dtype=torch.float)
         self.reset_buf = torch.ones(self.num_envs, device=self.device, dtype=torch.long)
-        self.timeout_buf = torch.zeros(self.num_envs, device=self.device, dtype=torch.long)
+        # * rebound by every step before it is read, no need to zero-fill
+        self.timeout_buf = torch.empty(self.num_envs, device=self.device, dtype=torch.long)
         self.progress_buf = torch.zeros(self.num_envs, device=self.device, dtype=torch.long)
         self.running_progress_buf = torch.zeros(self.num_envs, device=self.device, dtype=torch.long)
         self.randomize_buf = torch.zeros(self.num_envs, device=self.device, dtype=torch.long)
@@ -424,6 +477,33 @@ class VecTask(Env):
         self.extras = {}
         self.reward_dict = {}
 
+        # * error masks are all ones (never checked), so one buffer is handed out every step
+        self._error_masks_buf = torch.ones(self.num_envs, device=self.device, dtype=torch.float)
+        # * rl-device copies of the step outputs, reused instead of a fresh .to() allocation per step
+        self._same_rl_device = torch.device(self.rl_device) == torch.device(self.device)
+        # * gpu sim -> cpu learner: pinned buffers let the copies run async, synced once per call
+        self._pin_rl_bufs = torch.device(self.device).type == "cuda" and torch.device(self.rl_device).type == "cpu"
+        self._rl_bufs = {}
+
+    def _clip_obs(self, obs: torch.Tensor) -> torch.Tensor:
+        return torch.clamp(obs, -self.clip_obs, self.clip_obs) if self._needs_obs_clip else obs
+
+    def _to_rl_device(self, name: str, tensor: torch.Tensor) -> torch.Tensor:
+        """Copy `tensor` into the persistent rl-device buffer `name`, (re)allocated on shape / dtype change."""
+        if self._same_rl_device:
+            return tensor  # * what .to(rl_device) returns anyway
+        buf = self._rl_bufs.get(name, None)
+        if buf is None or buf.shape != tensor.shape or buf.dtype != tensor.dtype:
+            buf = self._rl_bufs[name] = torch.empty(
+                tensor.shape, dtype=tensor.dtype, device=self.rl_device, pin_memory=self._pin_rl_bufs
+            )
+        return buf.copy_(tensor, non_blocking=self._pin_rl_bufs)
+
+    def _sync_rl_device(self):
+        """Wait for the async copies issued by `_to_rl_device` before their buffers are read on the host."""
+        if self._pin_rl_bufs:
+            torch.cuda.current_stream(self.device).synchronize()
+
     def create_sim(
         self,
         compute_device: int,
@@ -450,7 +530,9 @@ class VecTask(Env):
 
     def get_state(self):
         """Returns the state buffer of the environment (the privileged observations for asymmetric training)."""
-        return torch.clamp(self.states_buf, -self.clip_obs, self.clip_obs).to(self.rl_device)
+        states = self._to_rl_device("states", self._clip_obs(self.states_buf))
+        self._sync_rl_device()
+        return states
 
     @abc.abstractmethod
     def pre_physics_step(self, actions: torch.Tensor):
@@ -478,7 +560,10 @@ class VecTask(Env):
         if self.dr_randomizations.get("actions", None):
             actions = self.dr_randomizations["actions"]["noise_lambda"](actions)
 
-        action_tensor = torch.clamp(actions, -self.clip_actions, self.clip_actions)
+        if self._needs_action_clip:
+            action_tensor = torch.clamp(actions, -self.clip_actions, self.clip_actions)
+        else:
+            action_tensor = actions
         # apply actions
         self.pre_physics_step(action_tensor)
 
@@ -504,28 +589,26 @@ class VecTask(Env):
         self.control_steps += 1
 
         # fill time out buffer: set to 1 if we reached the max episode length AND the reset buffer is 1. Timeout == 1 makes sense only if the reset buffer is 1.
-        self.timeout_buf = (self.progress_buf >= self.max_episode_length - 1) & (self.reset_buf != 0)
+        self.timeout_buf = compute_timeout(self.progress_buf, self.reset_buf, int(self.max_episode_length))
 
         # randomize observations
         if self.dr_randomizations.get("observations", None):
             self.obs_buf = self.dr_randomizations["observations"]["noise_lambda"](self.obs_buf)
 
-        self.extras["time_outs"] = self.timeout_buf.to(self.rl_device)
-        self.extras["error_masks"] = torch.ones_like((~self.error_buf).float())  # ! TODO: never checked
+        self.extras["time_outs"] = self._to_rl_device("time_outs", self.timeout_buf)
+        self.extras["error_masks"] = self._error_masks_buf  # ! TODO: never checked
 
         if not self.dict_obs_cls:
-            self.obs_dict["obs"] = torch.clamp(self.obs_buf, -self.clip_obs, self.clip_obs).to(self.rl_device)
+            self.obs_dict["obs"] = self._to_rl_device("obs", self._clip_obs(self.obs_buf))
 
             # asymmetric actor-critic
             if self.num_states > 0:
                 self.obs_dict["states"] = self.get_state()
 
-        return (
-            self.obs_dict,
-            self.rew_buf.to(self.rl_device),
-            self.reset_buf.to(self.rl_device),
-            self.extras,
-        )
+        rew = self._to_rl_device("rew", self.rew_buf)
+        reset = self._to_rl_device("reset", self.reset_buf)
+        self._sync_rl_device()
+        return self.obs_dict, rew, reset, self.extras
 
     def zero_actions(self) -> torch.Tensor:
         """Returns a buffer with zero actions.
@@ -554,11 +637,12 @@ class VecTask(Env):
             Observation dictionary
         """
         if not self.dict_obs_cls:
-            self.obs_dict["obs"] = torch.clamp(self.obs_buf, -self.clip_obs, self.clip_obs).to(self.rl_device)
+            self.obs_dict["obs"] = self._to_rl_device("obs", self._clip_obs(self.obs_buf))
 
             # asymmetric actor-critic
             if self.num_states > 0:
                 self.obs_dict["states"] = self.get_state()
+            self._sync_rl_device()
 
         return self.obs_dict
 
@@ -567,23 +651,24 @@ class VecTask(Env):
         Returns:
             Observation dictionary, indices of environments being reset
         """
-        done_env_ids = self.reset_buf.nonzero(as_tuple=False).flatten()
-        if len(done_env_ids) > 0:
+        done_env_ids = self.reset_buf.nonzero(as_tuple=True)[0]
+        if done_env_ids.numel() > 0:
             self.reset_idx(done_env_ids)
 
         if not self.dict_obs_cls:
-            self.obs_dict["obs"] = torch.clamp(self.obs_buf, -self.clip_obs, self.clip_obs).to(self.rl_device)
+            self.obs_dict["obs"] = self._to_rl_device("obs", self._clip_obs(self.obs_buf))
 
             # asymmetric actor-critic
             if self.num_states > 0:
                 self.obs_dict["states"] = self.get_state()
+            self._sync_rl_device()
 
         return self.obs_dict, done_env_ids
 
     def render(self, mode="rgb_array"):
         if self._rgb_viewr_renderer is not None:
-            rgbs = torch.stack(self.camera_obs)[..., :-1]  # RGBA -> RGB
-            rgbs = rgbs.permute(0, 3, 1, 2)  # (n, 3, H, W)
+            rgbs = torch.stack(self.camera_obs, out=self._cam_batch)[..., :-1]  # RGBA -> RGB
+            rgbs = rgbs.permute(0, 3, 1, 2)  # (n, 3, H, W), a view
             N = rgbs.shape[0]
             rgb_to_display = torchvision.utils.make_grid(rgbs, nrow=N // 2)
             self._rgb_viewr_renderer(rgb_to_display)
@@ -619,16 +704,11 @@ class VecTask(Env):
                 # this code will slow down the rendering to real time
                 now = time.time()
                 delta = now - self.last_frame_time
-                if self.render_fps < 0:
-                    # render at control frequency
-                    render_dt = self.dt * self.control_freq_inv  # render every control step
-                else:
-                    render_dt = 1.0 / self.render_fps
+                if delta < self._render_dt:
+                    time.sleep(self._render_dt - delta)
+                    now = time.time()
 
-                if delta < render_dt:
-                    time.sleep(render_dt - delta)
-
-                self.last_frame_time = time.time()
+                self.last_frame_time = now
 
             else:
                 self.gym.poll_viewer_events(self.viewer)
@@ -677,21 +757,12 @@ class VecTask(Env):
         # configure physics parameters
         if physics_engine == "physx":
             # set the parameters
-            if "physx" in config_sim:
-                for opt in config_sim["physx"].keys():
-                    if opt == "contact_collection":
-                        setattr(
-                            sim_params.physx,
-                            opt,
-                            gymapi.ContactCollection(config_sim["physx"][opt]),
-                        )
-                    else:
-                        setattr(sim_params.physx, opt, config_sim["physx"][opt])
+            for opt, value in config_sim.get("physx", {}).items():
+                setattr(sim_params.physx, opt, _PHYSX_CONVERTERS[opt](value) if opt in _PHYSX_CONVERTERS else value)
         else:
             # set the parameters
-            if "flex" in config_sim:
-                for opt in config_sim["flex"].keys():
-                    setattr(sim_params.flex, opt, config_sim["flex"][opt])
+            for opt, value in config_sim.get("flex", {}).items():
+                setattr(sim_params.flex, opt, value)
 
         # return the configured params
         return sim_params
@@ -700,6 +771,55 @@ class VecTask(Env):
     Domain Randomization methods
     """
 
+    def _actor_handles(self, actor: str):
+        """Per-env handles of `actor` (-1 where absent), looked up once instead of once per env per randomization."""
+        handles = self._actor_handle_table.get(actor, None)
+        if handles is None:
+            handles = self._actor_handle_table[actor] = [self.gym.find_actor_handle(env, actor) for env in self.envs]
+        return handles
+
+    def _dr_generator(self, device: torch.device) -> torch.Generator:
+        """Dedicated generator for the observation / action noise on `device`."""
+        gen = self._dr_generators.get(device, None)
+        if gen is None:
+            gen = self._dr_generators[device] = torch.Generator(device=device)
+            # * seeded from the (already seeded) global cpu generator: reproducible, but not the same
+            # * stream as the default cuda generator that e.g. samples the policy's actions
+            gen.manual_seed(int(torch.randint(2**62, (1,)).item()))
+        return gen
+
+    @staticmethod
+    def _dr_noise_buf(params: Dict[str, Any], tensor: torch.Tensor) -> torch.Tensor:
+        """Persistent noise buffer shaped like `tensor`, (re)allocated when its shape / dtype / device changes."""
+        buf = params.get("noise_buf", None)
+        if buf is None or buf.shape != tensor.shape or buf.dtype != tensor.dtype or buf.device != tensor.device:
+            buf = params["noise_buf"] = torch.empty_like(tensor)
+        return buf
+
+    def _dr_init_corr(self, param_name: str) -> Optional[torch.Tensor]:
+        """Correlated noise draw for `param_name`, allocated up front when its shape is already known."""
+        if param_name == "actions":
+            # * same layout as zero_actions()
+            shape, dtype, device = (self.num_envs, self.num_actions), torch.float32, torch.device(self.rl_device)
+        else:
+            ref = getattr(self, "obs_buf", None)
+            if not isinstance(ref, torch.Tensor):
+                return None  # * e.g. dict observations, drawn lazily on the first call instead
+            shape, dtype, device = ref.shape, ref.dtype, ref.device
+        # * redrawn in place into the previous registration's tensor when it still fits
+        corr = self.dr_randomizations.get(param_name, {}).get("corr", None)
+        if corr is None or corr.shape != shape or corr.dtype != dtype or corr.device != device:
+            return torch.randn(shape, dtype=dtype, device=device)
+        return corr.normal_()
+
+    @staticmethod
+    def _dr_corr(params: Dict[str, Any], tensor: torch.Tensor) -> torch.Tensor:
+        """Correlated noise draw matching `tensor`, redrawn only if the preallocated one does not fit."""
+        corr = params.get("corr", None)
+        if corr is None or corr.shape != tensor.shape or corr.dtype != tensor.dtype or corr.device != tensor.device:
+            corr = params["corr"] = torch.randn_like(tensor)
+        return corr
+
     def get_actor_params_info(self, dr_params: Dict[str, Any], env):
         """Generate a flat array of actor params, their names and ranges.
 
@@ -730,11 +850,12 @@ class VecTask(Env):
                         if "uniform" not in distr:
                             lo_hi = (-1.0 * float("Inf"), float("Inf"))
                         if isinstance(prop, np.ndarray):
-                            for attr_idx in range(prop[attr].shape[0]):
-                                params.append(prop[attr][attr_idx])
-                                names.append(name + "_" + str(attr_idx))
-                                lows.append(lo_hi[0])
-                                highs.append(lo_hi[1])
+                            vals = prop[attr]
+                            n_vals = vals.shape[0]
+                            params.extend(vals)
+                            names.extend(name + "_" + str(attr_idx) for attr_idx in range(n_vals))
+                            lows.extend([lo_hi[0]] * n_vals)
+                            highs.extend([lo_hi[1]] * n_vals)
                         else:
                             params.append(getattr(prop, attr))
                             names.append(name)
@@ -764,14 +885,10 @@ class VecTask(Env):
             env_ids = list(range(self.num_envs))
         else:
             do_nonenv_randomize = (self.last_step - self.last_rand_step) >= rand_freq
-            rand_envs = torch.where(
-                self.randomize_buf >= rand_freq,
-                torch.ones_like(self.randomize_buf),
-                torch.zeros_like(self.randomize_buf),
-            )
-            rand_envs = torch.logical_and(rand_envs, self.reset_buf)
-            env_ids = torch.nonzero(rand_envs, as_tuple=False).squeeze(-1).tolist()
-            self.randomize_buf[rand_envs] = 0
+            rand_envs = (self.randomize_buf >= rand_freq) & (self.reset_buf != 0)
+            # * resolved into a python list (a host sync) below, only when the per-env loops actually run
+            env_ids = None
+            self.randomize_buf.masked_fill_(rand_envs, 0)
 
         if do_nonenv_randomize:
             self.last_rand_step = self.last_step
@@ -787,28 +904,25 @@ class VecTask(Env):
 
         for nonphysical_param in ["observations", "actions"]:
             if nonphysical_param in dr_params and do_nonenv_randomize:
-                dist = dr_params[nonphysical_param]["distribution"]
-                op_type = dr_params[nonphysical_param]["operation"]
-                sched_type = (
-                    dr_params[nonphysical_param]["schedule"] if "schedule" in dr_params[nonphysical_param] else None
-                )
-                sched_step = (
-                    dr_params[nonphysical_param]["schedule_steps"]
-                    if "schedule" in dr_params[nonphysical_param]
-                    else None
-                )
+                param_cfg = dr_params[nonphysical_param]
+                dist = param_cfg["distribution"]
+                op_type = param_cfg["operation"]
+                sched_type = param_cfg["schedule"] if "schedule" in param_cfg else None
+                # * bound into each noise_lambda below, a free `op` would resolve to the last param's operation
                 op = operator.add if op_type == "additive" else operator.mul
 
                 if sched_type == "linear":
+                    sched_step = param_cfg["schedule_steps"]
                     sched_scaling = 1.0 / sched_step * min(self.last_step, sched_step)
                 elif sched_type == "constant":
+                    sched_step = param_cfg["schedule_steps"]
                     sched_scaling = 0 if self.last_step < sched_step else 1
                 else:
                     sched_scaling = 1
 
                 if dist == "gaussian":
-                    mu, var = dr_params[nonphysical_param]["range"]
-                    mu_corr, var_corr = dr_params[nonphysical_param].get("range_correlated", [0.0, 0.0])
+                    mu, var = param_cfg["range"]
+                    mu_corr, var_corr = param_cfg.get("range_correlated", [0.0, 0.0])
 
                     if op_type == "additive":
                         mu *= sched_scaling
@@ -822,29 +936,42 @@ class VecTask(Env):
                         var_corr = var_corr * sched_scaling  # scale up var over time
                         mu_corr = mu_corr * sched_scaling + 1.0 * (1.0 - sched_scaling)  # linearly interpolate
 
-                    def noise_lambda(tensor, param_name=nonphysical_param):
+                    # * opt-in: a zero-mean, unit-variance uniform stands in for the standard normal draw,
+                    # * same mean / std of the noise but a cheaper rng transform
+                    fast_uniform = param_cfg.get("fast_uniform", False)
+
+                    def noise_lambda(tensor, param_name=nonphysical_param, op=op, fast_uniform=fast_uniform):
                         params = self.dr_randomizations[param_name]
-                        corr = params.get("corr", None)
-                        if corr is None:
-                            corr = torch.randn_like(tensor)
-                            params["corr"] = corr
-                        corr = corr * params["var_corr"] + params["mu_corr"]
-                        return op(
-                            tensor,
-                            corr + torch.randn_like(tensor) * params["var"] + params["mu"],
+                        corr = self._dr_corr(params, tensor)
+                        noise_buf = self._dr_noise_buf(params, tensor)
+                        gen = self._dr_generator(tensor.device)
+                        if fast_uniform:
+                            noise_buf.uniform_(-SQRT_3, SQRT_3, generator=gen)
+                        else:
+                            noise_buf.normal_(generator=gen)
+                        noise = compute_gaussian_noise(
+                            noise_buf,
+                            corr,
+                            params["mu"],
+                            params["var"],
+                            params["mu_corr"],
+                            params["var_corr"],
                         )
+                        return op(tensor, noise)
 
                     self.dr_randomizations[nonphysical_param] = {
                         "mu": mu,
                         "var": var,
                         "mu_corr": mu_corr,
                         "var_corr": var_corr,
+                        "corr": self._dr_init_corr(nonphysical_param),
+                        "noise_buf": self.dr_randomizations.get(nonphysical_param, {}).get("noise_buf", None),
                         "noise_lambda": noise_lambda,
                     }
 
                 elif dist == "uniform":
-                    lo, hi = dr_params[nonphysical_param]["range"]
-                    lo_corr, hi_corr = dr_params[nonphysical_param].get("range_correlated", [0.0, 0.0])
+                    lo, hi = param_cfg["range"]
+                    lo_corr, hi_corr = param_cfg.get("range_correlated", [0.0, 0.0])
 
                     if op_type == "additive":
                         lo *= sched_scaling
@@ -857,23 +984,26 @@ class VecTask(Env):
                         lo_corr = lo_corr * sched_scaling + 1.0 * (1.0 - sched_scaling)
                         hi_corr = hi_corr * sched_scaling + 1.0 * (1.0 - sched_scaling)
 
-                    def noise_lambda(tensor, param_name=nonphysical_param):
+                    def noise_lambda(tensor, param_name=nonphysical_param, op=op):
                         params = self.dr_randomizations[param_name]
-                        corr = params.get("corr", None)
-                        if corr is None:
-                            corr = torch.randn_like(tensor)
-                            params["corr"] = corr
-                        corr = corr * (params["hi_corr"] - params["lo_corr"]) + params["lo_corr"]
-                        return op(
-                            tensor,
-                            corr + torch.rand_like(tensor) * (params["hi"] - params["lo"]) + params["lo"],
+                        corr = self._dr_corr(params, tensor)
+                        noise = compute_uniform_noise(
+                            self._dr_noise_buf(params, tensor).uniform_(generator=self._dr_generator(tensor.device)),
+                            corr,
+                            params["lo"],
+                            params["hi"],
+                            params["lo_corr"],
+                            params["hi_corr"],
                         )
+                        return op(tensor, noise)
 
                     self.dr_randomizations[nonphysical_param] = {
                         "lo": lo,
                         "hi": hi,
                         "lo_corr": lo_corr,
                         "hi_corr": hi_corr,
+                        "corr": self._dr_init_corr(nonphysical_param),
+                        "noise_buf": self.dr_randomizations.get(nonphysical_param, {}).get("noise_buf", None),
                         "noise_lambda": noise_lambda,
                     }
 
@@ -902,6 +1032,9 @@ class VecTask(Env):
         # freedom to generate samples from arbitrary distributions,
         # e.g. use full-covariance distributions instead of the DR's
         # default of treating each simulation parameter independently.
+        if env_ids is None and (do_nonenv_randomize or self.actor_params_generator is not None):
+            env_ids = torch.nonzero(rand_envs, as_tuple=True)[0].tolist()
+
         extern_offsets = {}
         if self.actor_params_generator is not None:
             assert False, "Not implemented"  # ! TODO, temp disabled
@@ -912,27 +1045,18 @@ class VecTask(Env):
         # randomise all attributes of each actor (hand, cube etc..)
         # actor_properties are (stiffness, damping etc..)
 
-        # Loop over actors, then loop over envs, then loop over their props
-        # and lastly loop over the ranges of the params
-
-        for actor, actor_properties in dr_params["actor_params"].items():
-            if not do_nonenv_randomize:
-                continue
-            # continue  # ! TODO: too slow during debugging
-            # Loop over all envs as this part is not tensorised yet
-            for env_id in env_ids:
-                env = self.envs[env_id]
-                handle = self.gym.find_actor_handle(env, actor)
-                if handle == -1:
-                    continue
-                extern_sample = self.extern_actor_params[env_id]
-
-                # randomise dof_props, rigid_body, rigid_shape properties
-                # all obtained from the YAML file
-                # EXAMPLE: prop name: dof_properties, rigid_body_properties, rigid_shape properties
-                #          prop_attrs:
-                #               {'damping': {'range': [0.3, 3.0], 'operation': 'scaling', 'distribution': 'loguniform'}
-                #               {'stiffness': {'range': [0.75, 1.5], 'operation': 'scaling', 'distribution': 'loguniform'}
+        # * resolve the per-(actor, prop) plan once: the setup_only filter, the external samples and the
+        # * getter / setter lookups only depend on the config and sim_initialized, not on the env
+        # randomise dof_props, rigid_body, rigid_shape properties
+        # all obtained from the YAML file
+        # EXAMPLE: prop name: dof_properties, rigid_body_properties, rigid_shape properties
+        #          prop_attrs:
+        #               {'damping': {'range': [0.3, 3.0], 'operation': 'scaling', 'distribution': 'loguniform'}
+        #               {'stiffness': {'range': [0.75, 1.5], 'operation': 'scaling', 'distribution': 'loguniform'}
+        actor_plans = []
+        if do_nonenv_randomize:
+            for actor, actor_properties in dr_params["actor_params"].items():
+                prop_plans = []
                 for prop_name, prop_attrs in actor_properties.items():
                     if prop_name == "color":
                         #     num_bodies = self.gym.get_actor_rigid_body_count(env, handle)
@@ -953,84 +1077,94 @@ class VecTask(Env):
                     if prop_name == "scale":
                         setup_only = prop_attrs.get("setup_only", False)
                         if (setup_only and not self.sim_initialized) or not setup_only:
-                            attr_randomization_params = prop_attrs
-                            sample = generate_random_samples(attr_randomization_params, 1, self.last_step, None)
-                            og_scale = 1
-                            if attr_randomization_params["operation"] == "scaling":
-                                new_scale = og_scale * sample
-                            elif attr_randomization_params["operation"] == "additive":
-                                new_scale = og_scale + sample
-                            self.gym.set_actor_scale(env, handle, new_scale)
+                            prop_plans.append((prop_name, prop_attrs, None, None, None, None))
                         continue
+                    # * the getters of these return a python list of structs (one per body / shape / tendon),
+                    # * dof_properties comes back as a numpy structured array and has no randomization path
+                    assert (
+                        prop_name in _LIST_ACTOR_PROPS
+                    ), f"actor_params.{actor}.{prop_name} can not be randomized, expected one of {_LIST_ACTOR_PROPS}"
+                    attr_plans = []
+                    for attr, attr_randomization_params in prop_attrs.items():
+                        setup_only = attr_randomization_params.get("setup_only", False)
+                        if (setup_only and not self.sim_initialized) or not setup_only:
+                            external_sample = get_external_sample(attr_randomization_params)
+                            shared_sample = None
+                            if attr_randomization_params.get("share_across_batch", False):
+                                # * opt-in: one draw per randomization for all envs (and all bodies / shapes)
+                                shared_sample = generate_random_samples(
+                                    attr_randomization_params, 1, self.last_step, external_sample
+                                )
+                            attr_plans.append((attr, attr_randomization_params, external_sample, shared_sample))
+                    prop_plans.append(
+                        (
+                            prop_name,
+                            prop_attrs,
+                            attr_plans,
+                            # * a prop is only written back if none of its attributes was filtered out
+                            len(attr_plans) == len(prop_attrs),
+                            param_getters_map[prop_name],
+                            (param_setters_map[prop_name], param_setter_defaults_map[prop_name]),
+                        )
+                    )
+                actor_plans.append((actor, prop_plans))
 
-                    prop = param_getters_map[prop_name](env, handle)
-                    set_random_properties = True
-
-                    if isinstance(prop, list):
-                        if self.first_randomization:
-                            if prop_name not in self.original_props:
-                                self.original_props[prop_name] = {}
-                            self.original_props[prop_name][f"{env_id}_{handle}"] = [
-                                {attr: save_getattr(p, attr) for attr in dir(p)} for p in prop
-                            ]
-                        for p, og_p in zip(prop, self.original_props[prop_name][f"{env_id}_{handle}"]):
-                            for attr, attr_randomization_params in prop_attrs.items():
-                                setup_only = attr_randomization_params.get("setup_only", False)
-                                if (setup_only and not self.sim_initialized) or not setup_only:
-                                    smpl = None
-                                    if self.actor_params_generator is not None:
-                                        (
-                                            smpl,
-                                            extern_offsets[env_id],
-                                        ) = get_attr_val_from_sample(
-                                            extern_sample,
-                                            extern_offsets[env_id],
-                                            p,
-                                            attr,
-                                        )
-                                    external_sample = get_external_sample(attr_randomization_params)
-                                    apply_random_samples(
-                                        p,
-                                        og_p,
-                                        attr,
-                                        attr_randomization_params,
-                                        self.last_step,
-                                        external_sample,
-                                    )
-                                else:
-                                    set_random_properties = False
+        # Loop over actors, then loop over envs, then loop over their props
+        # and lastly loop over the ranges of the params
+        for actor, prop_plans in actor_plans:
+            actor_handles = self._actor_handles(actor)
+            new_scales = None
+            for prop_name, prop_attrs, *_ in prop_plans:
+                if prop_name == "scale":
+                    # * one vectorized draw for all the envs instead of one per env
+                    attr_randomization_params = prop_attrs
+                    if attr_randomization_params.get("share_across_batch", False):
+                        # * opt-in: one draw shared by every env
+                        sample = generate_random_samples(attr_randomization_params, 1, self.last_step, None)
+                        sample = np.broadcast_to(sample, (len(env_ids),))
                     else:
-                        assert False, "Not implemented"
-                        if self.first_randomization:
-                            self.original_props[prop_name] = deepcopy(prop)
-                        for attr, attr_randomization_params in prop_attrs.items():
-                            setup_only = attr_randomization_params.get("setup_only", False)
-                            if (setup_only and not self.sim_initialized) or not setup_only:
-                                smpl = None
-                                if self.actor_params_generator is not None:
-                                    (
-                                        smpl,
-                                        extern_offsets[env_id],
-                                    ) = get_attr_val_from_sample(
-                                        extern_sample,
-                                        extern_offsets[env_id],
-                                        prop,
-                                        attr,
-                                    )
-                                apply_random_samples(
-                                    prop,
-                                    self.original_props[prop_name],
-                                    attr,
-                                    attr_randomization_params,
-                                    self.last_step,
-                                    smpl,
-                                )
-                            else:
-                                set_random_properties = False
+                        sample = generate_random_samples(attr_randomization_params, len(env_ids), self.last_step, None)
+                    og_scale = 1
+                    if attr_randomization_params["operation"] == "scaling":
+                        new_scales = og_scale * sample
+                    elif attr_randomization_params["operation"] == "additive":
+                        new_scales = og_scale + sample
+            # continue  # ! TODO: too slow during debugging
+            # Loop over all envs as this part is not tensorised yet
+            for env_idx, env_id in enumerate(env_ids):
+                env = self.envs[env_id]
+                handle = actor_handles[env_id]
+                if handle == -1:
+                    continue
+                for prop_name, prop_attrs, attr_plans, set_random_properties, getter, setter_args in prop_plans:
+                    if prop_name == "scale":
+                        self.gym.set_actor_scale(env, handle, float(new_scales[env_idx]))
+                        continue
+
+                    prop = getter(env, handle)
+
+                    if self.first_randomization:
+                        if prop_name not in self.original_props:
+                            self.original_props[prop_name] = {}
+                        # * only the randomized attributes are ever read back, no need to snapshot all of dir(p),
+                        # * kept as one array per attribute so a whole prop list is randomized in one go
+                        self.original_props[prop_name][(env_id, handle)] = {
+                            attr: np.array([save_getattr(p, attr) for p in prop]) for attr in prop_attrs
+                        }
+                    og_vals = self.original_props[prop_name][(env_id, handle)]
+                    for attr, attr_randomization_params, external_sample, shared_sample in attr_plans:
+                        apply_random_samples_list(
+                            prop,
+                            og_vals[attr],
+                            attr,
+                            attr_randomization_params,
+                            self.last_step,
+                            external_sample,
+                            sample=shared_sample,
+                        )
 
                     if set_random_properties:
-                        setter = param_setters_map[prop_name]
-                        default_args = param_setter_defaults_map[prop_name]
+                        setter, default_args = setter_args
                         setter(env, handle, prop, *default_args)
 
         if self.actor_params_generator is not None:
@@ -21,7 +21,7 @@ from main.dataset.factory import ManipDataFactory
 from main.dataset.transform import (
     aa_to_quat,
     aa_to_rotmat,
-    quat_to_rotmat,
+    batch_quat_rotate,
     rotmat_to_aa,
     rotmat_to_quat,
     rot6d_to_aa,
@@ -653,9 +653,9 @@ class DexHandImitatorRHEnv(VecTask):
                     pri_obs_values.append(self.states[ob] - self.states["base_state"][:, :3])
                 elif ob == "manip_obj_com":
                     cur_com_pos = (
-                        quat_to_rotmat(self.states["manip_obj_quat"][:, [1, 2, 3, 0]])
-                        @ self.manip_obj_com.unsqueeze(-1)
-                    ).squeeze(-1) + self.states["manip_obj_pos"]
+                        batch_quat_rotate(self.states["manip_obj_quat"][:, [1, 2, 3, 0]], self.manip_obj_com)
+                        + self.states["manip_obj_pos"]
+                    )
                     pri_obs_values.append(cur_com_pos - self.states["base_state"][:, :3])
                 elif ob == "manip_obj_weight":
                     prop = self.gym.get_sim_params(self.sim)
@@ -859,11 +859,12 @@ class DexHandImitatorRHEnv(VecTask):
             self.compute_observations()
 
         if not self.dict_obs_cls:
-            self.obs_dict["obs"] = torch.clamp(self.obs_buf, -self.clip_obs, self.clip_obs).to(self.rl_device)
+            self.obs_dict["obs"] = self._to_rl_device("obs", self._clip_obs(self.obs_buf))
 
             # asymmetric actor-critic
             if self.num_states > 0:
                 self.obs_dict["states"] = self.get_state()
+            self._sync_rl_device()
 
         return self.obs_dict, done_env_ids
 
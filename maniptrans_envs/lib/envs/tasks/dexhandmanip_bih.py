@@ -23,7 +23,14 @@ from main.dataset.factory import ManipDataFactory
 from main.dataset.oakink2_dataset_dexhand_lh import OakInk2DatasetDexHandLH
 from main.dataset.oakink2_dataset_dexhand_rh import OakInk2DatasetDexHandRH
 from main.dataset.oakink2_dataset_utils import oakink2_obj_scale, oakink2_obj_mass
-from main.dataset.transform import aa_to_quat, aa_to_rotmat, quat_to_rotmat, rotmat_to_aa, rotmat_to_quat, rot6d_to_aa
+from main.dataset.transform import (
+    aa_to_quat,
+    aa_to_rotmat,
+    batch_quat_rotate,
+    rotmat_to_aa,
+    rotmat_to_quat,
+    rot6d_to_aa,
+)
 from torch import Tensor
 from tqdm import tqdm
 from ...asset_root import ASSET_ROOT
@@ -1131,9 +1138,11 @@ class DexHandManipBiHEnv(VecTask):
                     pri_obs_values.append(side_states[ob] - side_states["base_state"][:, :3])
                 elif ob == "manip_obj_com":
                     cur_com_pos = (
-                        quat_to_rotmat(side_states["manip_obj_quat"][:, [1, 2, 3, 0]])
-                        @ getattr(self, f"manip_obj_{side}_com").unsqueeze(-1)
-                    ).squeeze(-1) + side_states["manip_obj_pos"]
+                        batch_quat_rotate(
+                            side_states["manip_obj_quat"][:, [1, 2, 3, 0]], getattr(self, f"manip_obj_{side}_com")
+                        )
+                        + side_states["manip_obj_pos"]
+                    )
                     pri_obs_values.append(cur_com_pos - side_states["base_state"][:, :3])
                 elif ob == "manip_obj_weight":
                     prop = self.gym.get_sim_params(self.sim)
@@ -1478,11 +1487,12 @@ class DexHandManipBiHEnv(VecTask):
             self.compute_observations()
 
         if not self.dict_obs_cls:
-            self.obs_dict["obs"] = torch.clamp(self.obs_buf, -self.clip_obs, self.clip_obs).to(self.rl_device)
+            self.obs_dict["obs"] = self._to_rl_device("obs", self._clip_obs(self.obs_buf))
 
             # asymmetric actor-critic
             if self.num_states > 0:
                 self.obs_dict["states"] = self.get_state()
+            self._sync_rl_device()
 
         return self.obs_dict, done_env_ids
 
@@ -169,6 +169,7 @@ def apply_random_samples(
     curr_gym_step_count,
     extern_sample=None,
     bucketing_randomization_params=None,
+    sample=None,
 ):
     """
     @params:
@@ -177,6 +178,7 @@ def apply_random_samples(
         attr: which particular attribute we want to randomise e.g. damping, stiffness
         attr_randomization_params: the attribute randomisation meta-data e.g. distr, range, schedule
         curr_gym_step_count: gym steps so far
+        sample: an already drawn sample (e.g. one shared across the batch), skips the draw
 
     """
 
@@ -202,9 +204,10 @@ def apply_random_samples(
             prop.physx.rest_offset = sample
 
     elif isinstance(prop, np.ndarray):
-        sample = generate_random_samples(
-            attr_randomization_params, prop[attr].shape, curr_gym_step_count, extern_sample
-        )
+        if sample is None:
+            sample = generate_random_samples(
+                attr_randomization_params, prop[attr].shape, curr_gym_step_count, extern_sample
+            )
 
         if attr_randomization_params["operation"] == "scaling":
             new_prop_val = og_prop[attr] * sample
@@ -215,7 +218,8 @@ def apply_random_samples(
             new_prop_val = get_bucketed_val(new_prop_val, attr_randomization_params)
         prop[attr] = new_prop_val
     else:
-        sample = generate_random_samples(attr_randomization_params, 1, curr_gym_step_count, extern_sample)
+        if sample is None:
+            sample = generate_random_samples(attr_randomization_params, 1, curr_gym_step_count, extern_sample)
         cur_attr_val = og_prop[attr]
         if attr_randomization_params["operation"] == "scaling":
             new_prop_val = cur_attr_val * sample
@@ -230,6 +234,39 @@ def apply_random_samples(
         setattr(prop, attr, new_prop_val)
 
 
+def apply_random_samples_list(
+    props,
+    og_vals,
+    attr,
+    attr_randomization_params,
+    curr_gym_step_count,
+    extern_sample=None,
+    sample=None,
+):
+    """
+    Same as apply_random_samples for a list of actor properties (e.g. one per rigid body / shape),
+    with a single draw for the whole list instead of one per element.
+    @params:
+        props: list of properties we want to randomise
+        og_vals: the original values of attr, one per element of props
+        sample: an already drawn sample (e.g. one shared across the batch), skips the draw
+    """
+
+    if sample is None:
+        sample = generate_random_samples(attr_randomization_params, len(props), curr_gym_step_count, extern_sample)
+    if attr_randomization_params["operation"] == "scaling":
+        new_prop_vals = og_vals * sample
+    elif attr_randomization_params["operation"] == "additive":
+        new_prop_vals = og_vals + sample
+    new_prop_vals = np.broadcast_to(new_prop_vals, (len(props),))
+
+    bucketing = "num_buckets" in attr_randomization_params and attr_randomization_params["num_buckets"] > 0
+    for prop, new_prop_val in zip(props, new_prop_vals.tolist()):
+        if bucketing:
+            new_prop_val = get_bucketed_val(new_prop_val, attr_randomization_params)
+        setattr(prop, attr, new_prop_val)
+
+
 def check_buckets(gym, envs, dr_params):
     total_num_buckets = 0
     for actor, actor_properties in dr_params["actor_params"].items():